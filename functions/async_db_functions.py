@@ -0,0 +1,310 @@
+import asyncio
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import pandas as pd
+from duckdb import DuckDBPyConnection
+
+from functions.db_functions import (
+    null_count_query,
+    relation_groups,
+    relation_query,
+    relation_results,
+)
+from functions.instrumentation_functions import instrument
+
+
+class AsyncQueryExecutor:
+    """
+    Runs independent DuckDB queries concurrently from asyncio.
+
+    The executor owns a pool of cursors of one connection, i.e. separate connections
+    to the same database, and a thread pool with one thread per cursor. A query takes
+    a free cursor, runs on a pool thread, and gives the cursor back when its result
+    is fetched. DuckDB releases the GIL while it executes, so the queries overlap. At
+    most max_concurrency queries run at once, and a cursor is never used by two
+    queries at the same time.
+
+    Attributes:
+        max_concurrency (int): The maximum number of queries running at once.
+
+    Methods:
+        fetch(query, parameters=None) -> DataFrame: Runs a query and fetches its result.
+        stream(queries) -> AsyncIterator[tuple]: Runs queries and yields their
+            results as they complete.
+        gather(queries) -> dict: Runs queries and returns all their results.
+        close() -> None: Closes the cursors and the thread pool.
+
+    Example:
+        >>> async with AsyncQueryExecutor(con, max_concurrency=4) as executor:
+        ...     async for key, result in executor.stream(queries):
+        ...         print(key, len(result))
+    """
+
+    def __init__(self, con: DuckDBPyConnection, max_concurrency: int = 4):
+        if max_concurrency < 1:
+            raise ValueError("The concurrency limit must be at least 1.")
+        self.max_concurrency = max_concurrency
+        self._cursors: queue.SimpleQueue = queue.SimpleQueue()
+        self._all_cursors = [con.cursor() for _ in range(max_concurrency)]
+        for cursor in self._all_cursors:
+            self._cursors.put(cursor)
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="duckdb-query"
+        )
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _run(self, query: str, parameters: Optional[Sequence[Any]]) -> pd.DataFrame:
+        cursor = self._cursors.get_nowait()
+        try:
+            if parameters is None:
+                return cursor.execute(query).df()
+            return cursor.execute(query, parameters).df()
+        finally:
+            self._cursors.put(cursor)
+
+    async def fetch(
+        self, query: str, parameters: Optional[Sequence[Any]] = None
+    ) -> pd.DataFrame:
+        """
+        Runs a query on a pooled cursor and fetches its result.
+
+        Args:
+            query (str): The SQL query.
+            parameters (sequence, optional): The values of the query's ? placeholders.
+
+        Returns:
+            DataFrame: The result of the query.
+        """
+        # A semaphore is bound to the event loop it is first used in, so a new one is
+        # created whenever the executor is used from another loop, e.g. asyncio.run
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        async with self._semaphore:
+            return await loop.run_in_executor(self._pool, self._run, query, parameters)
+
+    async def stream(
+        self, queries: Dict[Hashable, str]
+    ) -> AsyncIterator[Tuple[Hashable, pd.DataFrame]]:
+        """
+        Runs queries concurrently and yields their results as they complete.
+
+        Args:
+            queries (dict): The SQL queries, keyed by any name.
+
+        Yields:
+            tuple: The key and the result of every query, in order of completion.
+
+        Raises:
+            Exception: The error of the first failing query. The queries that are
+            still waiting are cancelled.
+        """
+
+        async def keyed(key: Hashable, query: str):
+            return key, await self.fetch(query)
+
+        tasks = [asyncio.ensure_future(keyed(key, q)) for key, q in queries.items()]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def gather(
+        self, queries: Dict[Hashable, str]
+    ) -> Dict[Hashable, pd.DataFrame]:
+        """
+        Runs queries concurrently and returns all their results.
+
+        Args:
+            queries (dict): The SQL queries, keyed by any name.
+
+        Returns:
+            dict: The results, in the order of queries.
+        """
+        results = {key: result async for key, result in self.stream(queries)}
+        return {key: results[key] for key in queries}
+
+    def close(self) -> None:
+        """Waits for the running queries and closes the thread pool and the cursors."""
+        self._pool.shutdown(wait=True)
+        for cursor in self._all_cursors:
+            cursor.close()
+
+    async def __aenter__(self) -> "AsyncQueryExecutor":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def __enter__(self) -> "AsyncQueryExecutor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+async def iter_data_quality(
+    executor: AsyncQueryExecutor,
+    tables: Optional[List[str]] = None,
+    relations: Iterable[Tuple[str, str, str, str]] = (),
+    row_limit: int = 5,
+) -> AsyncIterator[Tuple[str, Hashable, pd.DataFrame]]:
+    """
+    Runs the null counts of tables and the checks of relations concurrently.
+
+    Every table is one null count query, as in check_db_nulls, and every group of
+    relations with the same child table, parent table and parent key is one query,
+    as in check_db_relations. The results are yielded as the queries complete.
+
+    Args:
+        executor (AsyncQueryExecutor): The executor to run the queries with.
+        tables (list[str], optional): The tables to count nulls in, all tables of the
+            database if None.
+        relations (iterable[tuple]): (child_table, child_key, parent_table, parent_key)
+            tuples, where every child_key value should exist as a parent_key value.
+        row_limit (int): The number of unreferenced keys to sample per relation.
+
+    Yields:
+        tuple: ('nulls', table, null counts) for tables, with the 'null_count' and
+        'null_fraction' of every column as returned by check_db_nulls, and
+        ('relations', (child_table, parent_table, parent_key), results) for relation
+        groups, with one row per child key as returned by check_db_relations.
+
+    Raises:
+        ValueError: If a table does not exist.
+    """
+    columns = await executor.fetch(
+        """--sql
+        SELECT table_name, column_name
+        FROM information_schema.columns
+        ORDER BY table_name, ordinal_position
+        """
+    )
+    table_columns = columns.groupby("table_name", sort=False)["column_name"].agg(list)
+    if tables is None:
+        tables = list(table_columns.index)
+    missing = [table for table in tables if table not in table_columns.index]
+    if missing:
+        raise ValueError(f"Tables {missing} do not exist in the database.")
+
+    queries: Dict[Hashable, str] = {
+        ("nulls", table): null_count_query(table, table_columns[table])
+        for table in tables
+    }
+    groups = relation_groups(relations)
+    for group, child_keys in groups.items():
+        child_table, parent_table, parent_key = group
+        queries[("relations", group)] = relation_query(
+            child_table, child_keys, parent_table, parent_key, row_limit
+        )
+
+    async for (kind, key), result in executor.stream(queries):
+        if kind == "nulls":
+            total_rows = int(result.pop("_rows").iloc[0])
+            null_counts = pd.DataFrame(
+                {"null_count": result.iloc[0].astype(int).to_numpy()},
+                index=pd.Index(table_columns[key], name="column"),
+            )
+            null_counts["null_fraction"] = null_counts["null_count"] / max(
+                total_rows, 1
+            )
+            yield kind, key, null_counts
+        else:
+            child_table, parent_table, parent_key = key
+            group_relations = [
+                (child_table, child_key, parent_table, parent_key)
+                for child_key in groups[key]
+            ]
+            yield kind, key, relation_results([result], group_relations)
+
+
+async def check_db_quality_async(
+    con: DuckDBPyConnection,
+    tables: Optional[List[str]] = None,
+    relations: Sequence[Tuple[str, str, str, str]] = (),
+    row_limit: int = 5,
+    max_concurrency: int = 4,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Checks the nulls of tables and the referential integrity of relations concurrently.
+
+    Args:
+        con (DuckDBPyConnection): The DuckDB connection object.
+        tables (list[str], optional): The tables to count nulls in, all if None.
+        relations (sequence[tuple]): (child_table, child_key, parent_table, parent_key)
+            tuples, as in check_db_relations.
+        row_limit (int): The number of unreferenced keys to sample per relation.
+        max_concurrency (int): The maximum number of queries running at once.
+
+    Returns:
+        tuple: The null counts of all tables, indexed by table and column, and the
+        relation results in the order of relations, as returned by check_db_relations.
+
+    Example:
+        >>> nulls, relations = await check_db_quality_async(con, relations=relations)
+    """
+    null_counts, relation_frames = {}, []
+    with AsyncQueryExecutor(con, max_concurrency) as executor:
+        async for kind, key, result in iter_data_quality(
+            executor, tables, relations, row_limit
+        ):
+            if kind == "nulls":
+                null_counts[key] = result
+            else:
+                relation_frames.append(result)
+
+    if tables is None:
+        tables = sorted(null_counts)
+    nulls = pd.concat(
+        [null_counts[table] for table in tables],
+        keys=tables,
+        names=["table", "column"],
+    )
+
+    checks = relation_results(relation_frames, relations)
+    return nulls, checks
+
+
+@instrument()
+def check_db_quality(
+    con: DuckDBPyConnection,
+    tables: Optional[List[str]] = None,
+    relations: Sequence[Tuple[str, str, str, str]] = (),
+    row_limit: int = 5,
+    max_concurrency: int = 4,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Runs check_db_quality_async from synchronous code.
+
+    In a notebook, where an event loop is already running, await
+    check_db_quality_async instead.
+
+    Args:
+        con (DuckDBPyConnection): The DuckDB connection object.
+        tables (list[str], optional): The tables to count nulls in, all if None.
+        relations (sequence[tuple]): The relations to check, see check_db_relations.
+        row_limit (int): The number of unreferenced keys to sample per relation.
+        max_concurrency (int): The maximum number of queries running at once.
+
+    Returns:
+        tuple: The null counts and the relation results.
+    """
+    return asyncio.run(
+        check_db_quality_async(con, tables, relations, row_limit, max_concurrency)
+    )
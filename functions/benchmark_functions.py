@@ -0,0 +1,861 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from functions.data_access_functions import (
+    BOOKMAKERS,
+    PLAYER_ATTRIBUTE_RATINGS,
+    SCHEMAS,
+    TEAM_ATTRIBUTE_CLASSES,
+    TEAM_ATTRIBUTE_NUMERIC,
+    compact_table,
+    typed_table,
+)
+from functions.db_functions import check_db_nulls, check_db_refs, check_db_relations
+from functions.display_functions import get_correlation_pairs
+from functions.project_functions_classes import (
+    OUTCOMES,
+    AttributeIndex,
+    MatchLineupTensor,
+    MatchPlayers,
+    Team,
+    backtest_bets,
+    bet_away,
+    bet_home,
+    bet_tie,
+    classifier_train_prob_dif,
+    encode_outcomes,
+    predict_prob_dif,
+    predict_prob_win,
+    prob_dif_error_grid,
+    prob_win_error_grid,
+)
+
+# The row counts of the Kaggle database, which scale 1 reproduces
+KAGGLE_ROWS = {
+    "Country": 11,
+    "League": 11,
+    "Team": 299,
+    "Player": 11060,
+    "Team_Attributes": 1458,
+    "Player_Attributes": 183978,
+    "Match": 25979,
+}
+
+_SQUAD_SIZE = 37
+_TEAMS_PER_LEAGUE = 20
+_CHUNK_ROWS = 200_000
+_FIRST_DATE = np.datetime64("2008-07-18")
+_LAST_DATE = np.datetime64("2016-05-25")
+
+# (X, Y) lineup coordinates of a few formations, with the goalkeeper at (1, 1)
+_FORMATIONS = np.array(
+    [
+        [[1, 2, 4, 6, 8, 2, 4, 6, 8, 4, 6], [1, 3, 3, 3, 3, 7, 7, 7, 7, 11, 11]],
+        [[1, 2, 4, 6, 8, 3, 5, 7, 3, 5, 7], [1, 3, 3, 3, 3, 7, 7, 7, 10, 10, 10]],
+        [[1, 3, 5, 7, 1, 3, 5, 7, 9, 4, 6], [1, 3, 3, 3, 6, 7, 6, 7, 6, 11, 11]],
+        [[1, 2, 4, 6, 8, 4, 6, 2, 5, 8, 5], [1, 3, 3, 3, 3, 6, 6, 8, 8, 8, 11]],
+    ],
+    dtype=np.float64,
+)
+
+PLAYER_COLS = ["overall_rating", "potential", "stamina", "gk_reflexes"]
+
+
+def _random_dates(rng: np.random.Generator, size) -> np.ndarray:
+    """Returns uniformly distributed dates between the first and last Kaggle match."""
+    days = (_LAST_DATE - _FIRST_DATE).astype(np.int64)
+    return _FIRST_DATE + rng.integers(0, days + 1, size=size).astype("timedelta64[D]")
+
+
+def _seasons(dates: np.ndarray) -> np.ndarray:
+    """Returns the 'YYYY/YYYY' season of every date, with seasons starting in July."""
+    dates = pd.DatetimeIndex(dates)
+    start = dates.year - (dates.month < 7)
+    return (start.astype(str) + "/" + (start + 1).astype(str)).to_numpy()
+
+
+def _team_strengths(seed: int, n_teams: int) -> np.ndarray:
+    """Returns the hidden strength of every team that the match results depend on."""
+    return np.random.default_rng([seed, 0]).normal(0, 0.2, n_teams)
+
+
+def _outcome_probabilities(
+    home_goals_mean: np.ndarray, away_goals_mean: np.ndarray
+) -> np.ndarray:
+    """Returns the (Home Loss, Tie, Home Win) probabilities of independent Poisson scores."""
+    goals = np.arange(11)
+    log_factorials = np.cumsum(np.log(np.maximum(goals, 1)))
+
+    def poisson(mean: np.ndarray) -> np.ndarray:
+        return np.exp(goals * np.log(mean[:, None]) - mean[:, None] - log_factorials)
+
+    scores = poisson(home_goals_mean)[:, :, None] * poisson(away_goals_mean)[:, None, :]
+    difference = goals[:, None] - goals[None, :]
+    probs = np.stack(
+        [
+            scores[:, difference < 0].sum(axis=1),
+            scores[:, difference == 0].sum(axis=1),
+            scores[:, difference > 0].sum(axis=1),
+        ],
+        axis=1,
+    )
+    return probs / probs.sum(axis=1, keepdims=True)
+
+
+def _country_league_rows(n_leagues: int) -> Dict[str, pd.DataFrame]:
+    ids = np.arange(1, n_leagues + 1)
+    return {
+        "Country": pd.DataFrame({"id": ids, "name": [f"Country {i}" for i in ids]}),
+        "League": pd.DataFrame(
+            {"id": ids, "country_id": ids, "name": [f"League {i}" for i in ids]}
+        ),
+    }
+
+
+def _team_rows(n_teams: int) -> pd.DataFrame:
+    ids = np.arange(1, n_teams + 1)
+    return pd.DataFrame(
+        {
+            "id": ids,
+            "team_api_id": ids,
+            "team_fifa_api_id": ids + 100_000,
+            "team_long_name": [f"Team {i}" for i in ids],
+            "team_short_name": [f"T{i}" for i in ids],
+        }
+    )
+
+
+def _player_rows(rng: np.random.Generator, player_ids: np.ndarray) -> pd.DataFrame:
+    n_players = len(player_ids)
+    return pd.DataFrame(
+        {
+            "id": player_ids,
+            "player_api_id": player_ids,
+            "player_name": [f"Player {i}" for i in player_ids],
+            "player_fifa_api_id": player_ids + 1_000_000,
+            "birthday": np.datetime64("1980-01-01")
+            + rng.integers(0, 20 * 365, n_players).astype("timedelta64[D]"),
+            "height": np.round(rng.normal(181, 6.5, n_players), 2),
+            "weight": np.round(rng.normal(168, 15, n_players)),
+        }
+    )
+
+
+def _team_attribute_rows(
+    rng: np.random.Generator, team_ids: np.ndarray, first_id: int
+) -> pd.DataFrame:
+    # Yearly snapshots as in the Kaggle data, about 5 per team
+    years = np.arange(2010, 2016)
+    has_entry = rng.random((len(team_ids), len(years))) < 0.81
+    team_index, year_index = np.nonzero(has_entry)
+    n_rows = len(team_index)
+
+    data = {
+        "id": np.arange(first_id, first_id + n_rows),
+        "team_fifa_api_id": team_ids[team_index] + 100_000,
+        "team_api_id": team_ids[team_index],
+        "date": pd.to_datetime(
+            [f"{year}-02-22" for year in years[year_index]]
+            if n_rows
+            else np.array([], dtype="datetime64[ns]")
+        ),
+    }
+    for col in TEAM_ATTRIBUTE_NUMERIC:
+        values = np.round(np.clip(rng.normal(50, 12, n_rows), 20, 80))
+        data[col] = values
+        data[col + "Class"] = np.select(
+            [values < 34, values < 67], ["Low", "Medium"], "High"
+        )
+    # buildUpPlayDribbling is only recorded from 2014 on
+    data["buildUpPlayDribbling"] = np.where(
+        years[year_index] >= 2014, data["buildUpPlayDribbling"], np.nan
+    )
+    for col in TEAM_ATTRIBUTE_CLASSES[len(TEAM_ATTRIBUTE_NUMERIC) :]:
+        data[col] = rng.choice(["Organised", "Free Form", "Cover"], n_rows)
+    return pd.DataFrame(data)
+
+
+def _player_attribute_rows(
+    rng: np.random.Generator, player_ids: np.ndarray, first_id: int
+) -> pd.DataFrame:
+    n_entries = 1 + rng.poisson(
+        KAGGLE_ROWS["Player_Attributes"] / KAGGLE_ROWS["Player"] - 1, len(player_ids)
+    )
+    row_players = np.repeat(player_ids, n_entries)
+    n_rows = len(row_players)
+    base = np.repeat(rng.normal(66, 7, len(player_ids)), n_entries)
+
+    # The first entry of every player is from before the first match, as most are
+    # in the Kaggle data
+    dates = _random_dates(rng, n_rows)
+    dates[np.cumsum(n_entries) - n_entries] = np.datetime64("2007-02-22")
+
+    data = {
+        "id": np.arange(first_id, first_id + n_rows),
+        "player_fifa_api_id": row_players + 1_000_000,
+        "player_api_id": row_players,
+        "date": dates,
+        "preferred_foot": rng.choice(["right", "left"], n_rows, p=[0.76, 0.24]),
+        "attacking_work_rate": rng.choice(["high", "medium", "low"], n_rows),
+        "defensive_work_rate": rng.choice(["high", "medium", "low"], n_rows),
+    }
+    missing = rng.random(n_rows) < 0.005
+    for col in PLAYER_ATTRIBUTE_RATINGS:
+        values = np.round(np.clip(base + rng.normal(0, 10, n_rows), 1, 99))
+        data[col] = np.where(missing, np.nan, values)
+    return pd.DataFrame(data)
+
+
+def _match_rows(
+    rng: np.random.Generator,
+    n_matches: int,
+    first_id: int,
+    n_teams: int,
+    strengths: np.ndarray,
+) -> pd.DataFrame:
+    n_leagues = -(-n_teams // _TEAMS_PER_LEAGUE)
+    league = rng.integers(0, n_leagues, n_matches)
+    league_size = np.minimum(n_teams - league * _TEAMS_PER_LEAGUE, _TEAMS_PER_LEAGUE)
+    home = (rng.random(n_matches) * league_size).astype(np.int64)
+    away = (home + 1 + (rng.random(n_matches) * (league_size - 1)).astype(np.int64)) % (
+        league_size
+    )
+    home_team = league * _TEAMS_PER_LEAGUE + home
+    away_team = league * _TEAMS_PER_LEAGUE + away
+    dates = np.sort(_random_dates(rng, n_matches))
+
+    difference = strengths[home_team] - strengths[away_team]
+    home_goals_mean = np.exp(0.35 + difference)
+    away_goals_mean = np.exp(0.1 - difference)
+    probs = _outcome_probabilities(home_goals_mean, away_goals_mean)
+
+    data = {
+        "id": np.arange(first_id, first_id + n_matches),
+        "country_id": league + 1,
+        "league_id": league + 1,
+        "season": _seasons(dates),
+        "stage": rng.integers(1, 39, n_matches),
+        "date": dates,
+        "match_api_id": np.arange(first_id, first_id + n_matches) + 400_000,
+        "home_team_api_id": home_team + 1,
+        "away_team_api_id": away_team + 1,
+        "home_team_goal": rng.poisson(home_goals_mean),
+        "away_team_goal": rng.poisson(away_goals_mean),
+    }
+
+    # Eleven distinct squad players per side, with the lineups of some matches missing
+    no_lineup = rng.random(n_matches) < 0.04
+    formation = rng.integers(0, len(_FORMATIONS), (2, n_matches))
+    for side_number, (side, team) in enumerate(
+        [("home", home_team), ("away", away_team)]
+    ):
+        squad_slots = np.argsort(rng.random((n_matches, _SQUAD_SIZE)), axis=1)[:, :11]
+        player_ids = team[:, None] * _SQUAD_SIZE + squad_slots + 1
+        coordinates = _FORMATIONS[formation[side_number]]
+        for i in range(11):
+            data[f"{side}_player_{i + 1}"] = np.where(
+                no_lineup, np.nan, player_ids[:, i]
+            )
+            data[f"{side}_player_X{i + 1}"] = np.where(
+                no_lineup, np.nan, coordinates[:, 0, i]
+            )
+            data[f"{side}_player_Y{i + 1}"] = np.where(
+                no_lineup, np.nan, coordinates[:, 1, i]
+            )
+
+    for bookmaker in BOOKMAKERS:
+        margin = rng.uniform(1.04, 1.1)
+        missing = rng.random(n_matches) < (0.01 if bookmaker == "B365" else 0.1)
+        noise = np.exp(rng.normal(0, 0.03, (n_matches, 3)))
+        odds = np.round(noise / (probs * margin), 2)
+        for outcome, column in zip(("A", "D", "H"), odds.T):
+            data[bookmaker + outcome] = np.where(missing, np.nan, column)
+    return pd.DataFrame(data)
+
+
+def _insert(con: duckdb.DuckDBPyConnection, table: str, rows: pd.DataFrame) -> None:
+    con.register("_rows", rows)
+    con.execute(f"INSERT INTO {table} BY NAME SELECT * FROM _rows")
+    con.unregister("_rows")
+
+
+def generate_database(path: str, scale: int = 1, seed: int = 0) -> str:
+    """
+    Generates a synthetic football database with the schema of the Kaggle database.
+
+    The Match, Player_Attributes and Team_Attributes tables, and the tables they
+    reference, are generated with about scale times the Kaggle row counts. Teams and
+    players are scaled with the matches, so every team plays as many matches and
+    every player has as many attribute entries as in the Kaggle data. The data is
+    generated in chunks and is the same for the same scale and seed.
+
+    Args:
+        path (str): The DuckDB file to write. An existing file is overwritten.
+        scale (int, optional): The multiple of the Kaggle row counts to generate.
+        seed (int, optional): The random seed.
+
+    Returns:
+        str: The path of the DuckDB file.
+    """
+    temp_path = path + ".tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    n_teams = KAGGLE_ROWS["Team"] * scale
+    n_players = n_teams * _SQUAD_SIZE
+    strengths = _team_strengths(seed, n_teams)
+
+    con = duckdb.connect(temp_path)
+    try:
+        for table, schema in SCHEMAS.items():
+            columns = ", ".join(f'"{col}" {dtype}' for col, dtype in schema.items())
+            con.execute(f"CREATE TABLE {table} ({columns})")
+
+        for table, rows in _country_league_rows(
+            -(-n_teams // _TEAMS_PER_LEAGUE)
+        ).items():
+            _insert(con, table, rows)
+        _insert(con, "Team", _team_rows(n_teams))
+        _insert(
+            con,
+            "Team_Attributes",
+            _team_attribute_rows(
+                np.random.default_rng([seed, 1]), np.arange(1, n_teams + 1), 1
+            ),
+        )
+
+        chunk_players = _CHUNK_ROWS // 17
+        first_id = 1
+        for chunk, start in enumerate(range(0, n_players, chunk_players)):
+            player_ids = np.arange(start, min(start + chunk_players, n_players)) + 1
+            rng = np.random.default_rng([seed, 2, chunk])
+            _insert(con, "Player", _player_rows(rng, player_ids))
+            rows = _player_attribute_rows(rng, player_ids, first_id)
+            _insert(con, "Player_Attributes", rows)
+            first_id += len(rows)
+
+        n_matches = KAGGLE_ROWS["Match"] * scale
+        for chunk, start in enumerate(range(0, n_matches, _CHUNK_ROWS)):
+            rng = np.random.default_rng([seed, 3, chunk])
+            size = min(_CHUNK_ROWS, n_matches - start)
+            _insert(
+                con, "Match", _match_rows(rng, size, start + 1, n_teams, strengths)
+            )
+    finally:
+        con.close()
+    os.replace(temp_path, path)
+    return path
+
+
+def measure(func: Callable[[], Any], items: int, repeat: int = 3) -> Dict[str, Any]:
+    """
+    Measures the run time and peak memory of a function.
+
+    The function is timed repeat times with time.perf_counter, and run once more under
+    tracemalloc for the peak memory, so that tracing does not slow down the timed runs.
+    tracemalloc only sees memory allocated through Python, which includes numpy and
+    pandas arrays but not the memory DuckDB allocates for a query.
+
+    Args:
+        func (Callable): The function to measure, called without arguments.
+        items (int): The number of items, e.g. matches, the function processes.
+        repeat (int, optional): The number of timed runs.
+
+    Returns:
+        dict: The 'items', the median and minimum 'seconds', the 'throughput' in items
+        per second and the 'peak_memory_mb' of the function.
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    seconds = float(np.median(times))
+    return {
+        "items": int(items),
+        "seconds": seconds,
+        "min_seconds": float(min(times)),
+        "throughput": items / seconds if seconds > 0 else None,
+        "peak_memory_mb": peak / 2**20,
+    }
+
+
+def _load_data(
+    con: duckdb.DuckDBPyConnection,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Loads the team attributes, the player attributes and the matches with lineups."""
+    team_attributes = con.sql("SELECT * FROM Team_Attributes").df()
+    player_attributes = con.sql(
+        "SELECT player_api_id, date, "
+        + ", ".join(PLAYER_COLS)
+        + " FROM Player_Attributes"
+    ).df()
+    matches = (
+        con.sql("SELECT * FROM Match WHERE home_player_1 IS NOT NULL ORDER BY id")
+        .df()
+        .set_index("id")
+    )
+    return team_attributes, player_attributes, matches
+
+
+def _match_players_rows(
+    rows: pd.DataFrame, player_attributes: pd.DataFrame, how: str
+) -> List[dict]:
+    """Builds and exports MatchPlayers for every row, the way the analysis notebook does."""
+    exports = []
+    for _, row in rows.iterrows():
+        match_players = MatchPlayers()
+        match_players.get_data(row)
+        match_players.get_player_positions()
+        match_players.get_player_ids()
+        for players in (match_players.home_players, match_players.away_players):
+            players["goaly"].get_player_attributes(player_attributes, row["date"])
+            for player in players["players"]:
+                player.get_player_attributes(player_attributes, row["date"])
+        exports.append(match_players.export_player_attributes(PLAYER_COLS, how))
+    return exports
+
+
+def benchmark_cases(
+    con: duckdb.DuckDBPyConnection, sample_size: int = 200
+) -> Dict[str, Tuple[Callable[[], Any], int]]:
+    """
+    Returns the benchmarked functions of a database, each with its number of items.
+
+    Row by row implementations are run on the first sample_size matches with lineups,
+    and MatchPlayers, which filters the player attributes 22 times per match, on a
+    tenth of them. Batched implementations are run on all matches with lineups.
+
+    Args:
+        con (DuckDBPyConnection): A connection to a database from generate_database.
+        sample_size (int, optional): The number of matches of row by row cases.
+
+    Returns:
+        dict: (function, items) tuples keyed by case name.
+    """
+    team_attributes, player_attributes, matches = _load_data(con)
+    sample = matches.iloc[:sample_size]
+    player_sample = matches.iloc[: max(sample_size // 10, 1)]
+    n_match_rows = con.sql("SELECT COUNT(*) FROM Match").fetchone()[0]
+    n_player_rows = con.sql("SELECT COUNT(*) FROM Player_Attributes").fetchone()[0]
+
+    teams = {}
+    for team_id in team_attributes["team_api_id"].unique():
+        teams[team_id] = Team(team_id)
+        teams[team_id].get_data(team_attributes)
+
+    def get_team_data():
+        for team_id in teams:
+            Team(team_id).get_data(team_attributes)
+
+    indexed_teams = Team.from_data(team_attributes)
+
+    def get_latest_entries(teams):
+        return [
+            teams[team_id].get_latest_entry(date, TEAM_ATTRIBUTE_NUMERIC)
+            for team_id, date in zip(sample["home_team_api_id"], sample["date"])
+        ]
+
+    team_index = AttributeIndex(team_attributes)
+    player_index = AttributeIndex(player_attributes, id_name="player_api_id")
+    tensor = MatchLineupTensor.from_matches(matches, player_index, PLAYER_COLS)
+    player_features = tensor.export_player_attributes("all")
+
+    relations = [
+        ("Match", f"{side}_player_{i}", "Player", "player_api_id")
+        for side in ("home", "away")
+        for i in range(1, 12)
+    ] + [
+        ("Match", f"{side}_team_api_id", "Team", "team_api_id")
+        for side in ("home", "away")
+    ]
+
+    def check_refs():
+        with contextlib.redirect_stdout(io.StringIO()):
+            check_db_refs(con, "Match", "Team", "home_team_api_id", "team_api_id")
+
+    # Predicted probabilities from the normalized implied probabilities of the odds
+    odds = matches[["B365A", "B365D", "B365H"]].to_numpy()
+    implied = 1 / odds
+    probs = implied / implied.sum(axis=1, keepdims=True)
+    outcome_names = np.array(OUTCOMES)[
+        np.sign(matches["home_team_goal"] - matches["away_team_goal"]).to_numpy() + 1
+    ]
+    prob_data = pd.DataFrame(
+        {"win": probs[:, 2], "loss": probs[:, 0]}, index=matches.index
+    )
+    y_data = pd.Series(outcome_names, index=matches.index)
+    bets = predict_prob_dif(probs[:, 2], probs[:, 0], 0.1, 0.25)
+    bet_mask = encode_outcomes(bets)[:, None] == np.arange(len(OUTCOMES))
+    coefs = np.linspace(0.01, 0.5, 50)
+
+    # The row by row bet functions take outcome names, not codes
+    labels = np.array(OUTCOMES)[bets]
+    betting_df = pd.DataFrame(
+        {
+            "home_win_pred": (labels == "Home Win").astype(int),
+            "away_win_pred": (labels == "Home Loss").astype(int),
+            "tie_pred": labels,
+            "outcome": outcome_names,
+            "home_win_coef": odds[:, 2],
+            "away_win_coef": odds[:, 0],
+            "tie_coef": odds[:, 1],
+        },
+        index=matches.index,
+    ).iloc[:sample_size]
+
+    def bet_rowwise():
+        return [betting_df.apply(bet, axis=1) for bet in (bet_home, bet_away, bet_tie)]
+
+    # Both betting cases must do the same work for their timings to be comparable
+    rowwise_profit = sum(bet_rowwise()).to_numpy(dtype=np.float64)
+    vectorized_profit = backtest_bets(
+        bet_mask[:sample_size], outcome_names[:sample_size], odds[:sample_size]
+    )[0].sum(axis=1)
+    if not np.allclose(rowwise_profit, vectorized_profit, equal_nan=True):
+        raise RuntimeError("bet_rowwise and backtest_bets give different profits.")
+
+    return {
+        "team_get_data": (get_team_data, len(teams)),
+        "team_get_latest_entry": (lambda: get_latest_entries(teams), len(sample)),
+        "team_from_data": (lambda: Team.from_data(team_attributes), len(teams)),
+        "team_get_latest_entry_indexed": (
+            lambda: get_latest_entries(indexed_teams),
+            len(sample),
+        ),
+        "attribute_index_latest_entries": (
+            lambda: team_index.latest_entries(
+                matches, "home_team_api_id", TEAM_ATTRIBUTE_NUMERIC
+            ),
+            len(matches),
+        ),
+        "match_players_build_export": (
+            lambda: _match_players_rows(player_sample, player_attributes, "avg_diff"),
+            len(player_sample),
+        ),
+        "match_lineup_tensor_build_export": (
+            lambda: MatchLineupTensor.from_matches(
+                matches, player_index, PLAYER_COLS
+            ).export_player_attributes("avg_diff"),
+            len(matches),
+        ),
+        "typed_player_attributes": (
+            lambda: typed_table(con, "Player_Attributes").df(),
+            n_player_rows,
+        ),
+        "compact_player_attributes": (
+            lambda: compact_table(con, "Player_Attributes"),
+            n_player_rows,
+        ),
+        "check_db_nulls": (
+            lambda: check_db_nulls(con, "Match", display_results=False),
+            n_match_rows,
+        ),
+        "check_db_refs": (check_refs, n_match_rows),
+        "check_db_relations": (
+            lambda: check_db_relations(con, relations, display_results=False),
+            n_match_rows,
+        ),
+        "get_correlation_pairs": (
+            lambda: get_correlation_pairs(player_features, 0.85, -0.85),
+            len(player_features),
+        ),
+        "bet_rowwise": (bet_rowwise, len(betting_df)),
+        "backtest_bets": (
+            lambda: backtest_bets(bet_mask, outcome_names, odds),
+            len(matches),
+        ),
+        "classifier_train_prob_dif": (
+            lambda: classifier_train_prob_dif(
+                {"coef_a": 0.1, "coef_b": 0.25}, prob_data, y_data
+            ),
+            len(matches),
+        ),
+        "predict_prob_win": (
+            lambda: predict_prob_win(probs[:, 2], 0.45, 0.25),
+            len(matches),
+        ),
+        "prob_dif_error_grid": (
+            lambda: prob_dif_error_grid(prob_data, y_data, coefs, coefs),
+            len(matches),
+        ),
+        "prob_win_error_grid": (
+            lambda: prob_win_error_grid(prob_data["win"], y_data, coefs, coefs),
+            len(matches),
+        ),
+    }
+
+
+# The modules workers import, with their import time budgets in seconds
+IMPORT_BUDGETS = {
+    "functions.instrumentation_functions": 0.5,
+    "functions.data_format_functions": 0.5,
+    "functions.project_functions_classes": 0.5,
+    "functions.model_functions": 0.5,
+    "functions.formation_functions": 0.5,
+    "functions.data_access_functions": 0.5,
+    "functions.db_functions": 0.5,
+    "functions.async_db_functions": 0.5,
+    "functions.parallel_functions": 0.5,
+    "functions.scoring_functions": 0.5,
+    "functions.display_functions": 0.5,
+}
+
+# The display dependencies that must only be imported on first use
+DISPLAY_MODULES = ["IPython", "matplotlib", "seaborn", "tabulate"]
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [
+    name for name in {display_modules!r} if name in sys.modules
+]}}))
+"""
+
+
+def measure_import(module: str, repeat: int = 5) -> Dict[str, Any]:
+    """
+    Measures the time it takes a fresh interpreter to import a module.
+
+    Every run imports the module in a new Python process started from the repository
+    root, which is what a process pool worker does at startup.
+
+    Args:
+        module (str): The module to import, e.g. 'functions.project_functions_classes'.
+        repeat (int, optional): The number of runs.
+
+    Returns:
+        dict: The median and minimum import 'seconds' and the display modules the
+        import 'loaded', see DISPLAY_MODULES.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = _IMPORT_SCRIPT.format(module=module, display_modules=DISPLAY_MODULES)
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    times = [run["seconds"] for run in runs]
+    return {
+        "seconds": float(np.median(times)),
+        "min_seconds": float(min(times)),
+        "loaded": runs[-1]["loaded"],
+    }
+
+
+def check_import_budgets(
+    budgets: Optional[Dict[str, float]] = None, repeat: int = 5
+) -> pd.DataFrame:
+    """
+    Checks that modules import within their time budget and without display modules.
+
+    Args:
+        budgets (dict, optional): The budget in seconds of every module, IMPORT_BUDGETS
+            if None.
+        repeat (int, optional): The number of runs per module.
+
+    Returns:
+        DataFrame: The median 'seconds', 'budget', 'display_modules' loaded and whether
+        the module is 'within_budget', indexed by module.
+
+    Raises:
+        RuntimeError: If a module exceeds its budget or loads a display module.
+    """
+    budgets = IMPORT_BUDGETS if budgets is None else budgets
+    rows = []
+    for module, budget in budgets.items():
+        result = measure_import(module, repeat)
+        rows.append(
+            {
+                "module": module,
+                "seconds": result["seconds"],
+                "budget": budget,
+                "display_modules": ", ".join(result["loaded"]),
+                "within_budget": result["seconds"] <= budget and not result["loaded"],
+            }
+        )
+    report = pd.DataFrame(rows).set_index("module")
+    failed = report.loc[~report["within_budget"]]
+    if len(failed):
+        raise RuntimeError("Modules over their import budget:\n" + failed.to_string())
+    return report
+
+
+def run_benchmarks(
+    scales: List[int] = (1, 10),
+    data_dir: str = "benchmark_data",
+    repeat: int = 3,
+    sample_size: int = 200,
+    cases: Optional[List[str]] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Runs the benchmark cases on synthetic databases of the given scales.
+
+    Databases are generated into data_dir on the first run and reused afterwards.
+    A scale of 100 generates about 18 million player attribute entries, so it takes
+    several GB of disk space and memory.
+
+    Args:
+        scales (list[int], optional): The multiples of the Kaggle row counts to run.
+        data_dir (str, optional): The directory of the generated databases.
+        repeat (int, optional): The number of timed runs of every case.
+        sample_size (int, optional): The number of matches of row by row cases.
+        cases (list[str], optional): The names of the cases to run, all if None.
+        seed (int, optional): The random seed of newly generated databases.
+
+    Returns:
+        dict: The 'meta' data of the run and a list of 'results', one per scale and case.
+
+    Example:
+        >>> results = run_benchmarks([1], repeat=1)
+        >>> save_results(results, "benchmark.json")
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    results = []
+    for scale in scales:
+        path = os.path.join(data_dir, f"football_x{scale}_seed{seed}.duckdb")
+        if not os.path.exists(path):
+            generate_database(path, scale, seed)
+
+        con = duckdb.connect(path, read_only=True)
+        try:
+            scale_cases = benchmark_cases(con, sample_size)
+            for name, (func, items) in scale_cases.items():
+                if cases is not None and name not in cases:
+                    continue
+                results.append(
+                    {"scale": scale, "name": name, **measure(func, items, repeat)}
+                )
+        finally:
+            con.close()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "duckdb": duckdb.__version__,
+            "repeat": repeat,
+            "sample_size": sample_size,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def save_results(results: Dict[str, Any], path: str) -> None:
+    """
+    Saves benchmark results as JSON.
+
+    Args:
+        results (dict): The results of run_benchmarks.
+        path (str): The JSON file to write.
+    """
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+
+
+def compare_results(baseline_path: str, current_path: str) -> pd.DataFrame:
+    """
+    Compares two saved benchmark runs.
+
+    Args:
+        baseline_path (str): The JSON file of the baseline run.
+        current_path (str): The JSON file of the run to compare.
+
+    Returns:
+        DataFrame: The seconds and peak memory of both runs, and their ratios, indexed
+        by scale and case name. A 'time_ratio' above 1 means the current run is slower.
+    """
+    frames = []
+    for path, suffix in ((baseline_path, "_baseline"), (current_path, "_current")):
+        with open(path) as file:
+            frame = pd.DataFrame(json.load(file)["results"])
+        frames.append(
+            frame.set_index(["scale", "name"])[["seconds", "peak_memory_mb"]].add_suffix(
+                suffix
+            )
+        )
+    comparison = frames[0].join(frames[1], how="outer")
+    comparison["time_ratio"] = (
+        comparison["seconds_current"] / comparison["seconds_baseline"]
+    )
+    comparison["memory_ratio"] = (
+        comparison["peak_memory_mb_current"] / comparison["peak_memory_mb_baseline"]
+    )
+    return comparison
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the feature pipeline on synthetic football databases."
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--data-dir", default="benchmark_data")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--sample-size", type=int, default=200)
+    parser.add_argument("--cases", nargs="+", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--compare", default=None, help="A saved run to compare the results with."
+    )
+    parser.add_argument(
+        "--check-imports",
+        action="store_true",
+        help="Only checks the import time budgets of the modules.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.check_imports:
+        try:
+            print(check_import_budgets(repeat=args.repeat).to_string())
+        except RuntimeError as error:
+            sys.exit(str(error))
+        return
+
+    results = run_benchmarks(
+        args.scales, args.data_dir, args.repeat, args.sample_size, args.cases, args.seed
+    )
+    save_results(results, args.output)
+    print(pd.DataFrame(results["results"]).to_string(index=False))
+    if args.compare:
+        print(compare_results(args.compare, args.output).to_string())
+
+
+if __name__ == "__main__":
+    main()
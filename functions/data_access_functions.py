@@ -0,0 +1,403 @@
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+from duckdb import DuckDBPyConnection, DuckDBPyRelation
+
+from functions.data_format_functions import MISSING_DAY, compact_attributes
+
+PLAYER_ATTRIBUTE_RATINGS = [
+    "overall_rating",
+    "potential",
+    "crossing",
+    "finishing",
+    "heading_accuracy",
+    "short_passing",
+    "volleys",
+    "dribbling",
+    "curve",
+    "free_kick_accuracy",
+    "long_passing",
+    "ball_control",
+    "acceleration",
+    "sprint_speed",
+    "agility",
+    "reactions",
+    "balance",
+    "shot_power",
+    "jumping",
+    "stamina",
+    "strength",
+    "long_shots",
+    "aggression",
+    "interceptions",
+    "positioning",
+    "vision",
+    "penalties",
+    "marking",
+    "standing_tackle",
+    "sliding_tackle",
+    "gk_diving",
+    "gk_handling",
+    "gk_kicking",
+    "gk_positioning",
+    "gk_reflexes",
+]
+
+TEAM_ATTRIBUTE_NUMERIC = [
+    "buildUpPlaySpeed",
+    "buildUpPlayDribbling",
+    "buildUpPlayPassing",
+    "chanceCreationPassing",
+    "chanceCreationCrossing",
+    "chanceCreationShooting",
+    "defencePressure",
+    "defenceAggression",
+    "defenceTeamWidth",
+]
+
+TEAM_ATTRIBUTE_CLASSES = [col + "Class" for col in TEAM_ATTRIBUTE_NUMERIC] + [
+    "buildUpPlayPositioningClass",
+    "chanceCreationPositioningClass",
+    "defenceDefenderLineClass",
+]
+
+BOOKMAKERS = ["B365", "BW", "IW", "LB", "PS", "WH", "SJ", "VC", "GB", "BS"]
+
+_LINEUP_SLOTS = range(1, 12)
+
+MATCH_LINEUP_COLUMNS = [
+    f"{side}_player_{col}{i}"
+    for side in ("home", "away")
+    for col in ("", "X", "Y")
+    for i in _LINEUP_SLOTS
+]
+
+# The Match columns needed to build match features
+MATCH_FEATURE_COLUMNS = [
+    "id",
+    "season",
+    "date",
+    "home_team_api_id",
+    "away_team_api_id",
+] + MATCH_LINEUP_COLUMNS
+
+# The DuckDB type of every column of the database, used to cast the columns of
+# the SQLite file attached with sqlite_all_varchar
+SCHEMAS: Dict[str, Dict[str, str]] = {
+    "Country": {"id": "BIGINT", "name": "VARCHAR"},
+    "League": {"id": "BIGINT", "country_id": "BIGINT", "name": "VARCHAR"},
+    "Player": {
+        "id": "BIGINT",
+        "player_api_id": "BIGINT",
+        "player_name": "VARCHAR",
+        "player_fifa_api_id": "BIGINT",
+        "birthday": "TIMESTAMP",
+        "height": "DOUBLE",
+        "weight": "DOUBLE",
+    },
+    "Player_Attributes": {
+        "id": "BIGINT",
+        "player_fifa_api_id": "BIGINT",
+        "player_api_id": "BIGINT",
+        "date": "TIMESTAMP",
+        "overall_rating": "DOUBLE",
+        "potential": "DOUBLE",
+        "preferred_foot": "VARCHAR",
+        "attacking_work_rate": "VARCHAR",
+        "defensive_work_rate": "VARCHAR",
+        **{col: "DOUBLE" for col in PLAYER_ATTRIBUTE_RATINGS[2:]},
+    },
+    "Team": {
+        "id": "BIGINT",
+        "team_api_id": "BIGINT",
+        "team_fifa_api_id": "BIGINT",
+        "team_long_name": "VARCHAR",
+        "team_short_name": "VARCHAR",
+    },
+    "Team_Attributes": {
+        "id": "BIGINT",
+        "team_fifa_api_id": "BIGINT",
+        "team_api_id": "BIGINT",
+        "date": "TIMESTAMP",
+        **{col: "DOUBLE" for col in TEAM_ATTRIBUTE_NUMERIC},
+        **{col: "VARCHAR" for col in TEAM_ATTRIBUTE_CLASSES},
+    },
+    "Match": {
+        "id": "BIGINT",
+        "country_id": "BIGINT",
+        "league_id": "BIGINT",
+        "season": "VARCHAR",
+        "stage": "BIGINT",
+        "date": "TIMESTAMP",
+        "match_api_id": "BIGINT",
+        "home_team_api_id": "BIGINT",
+        "away_team_api_id": "BIGINT",
+        "home_team_goal": "BIGINT",
+        "away_team_goal": "BIGINT",
+        **{
+            f"{side}_player_{axis}{i}": "DOUBLE"
+            for axis in ("X", "Y")
+            for side in ("home", "away")
+            for i in _LINEUP_SLOTS
+        },
+        **{
+            f"{side}_player_{i}": "BIGINT"
+            for side in ("home", "away")
+            for i in _LINEUP_SLOTS
+        },
+        **{
+            col: "VARCHAR"
+            for col in [
+                "goal",
+                "shoton",
+                "shotoff",
+                "foulcommit",
+                "card",
+                "cross",
+                "corner",
+                "possession",
+            ]
+        },
+        **{
+            bookmaker + outcome: "DOUBLE"
+            for bookmaker in BOOKMAKERS
+            for outcome in ("H", "D", "A")
+        },
+    },
+}
+
+
+def quote_identifier(name: str) -> str:
+    """Quotes an identifier for use in a DuckDB query."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def typed_columns(table: str, columns: Optional[List[str]] = None) -> str:
+    """
+    Builds the select list that casts the given columns of a table to their declared types.
+
+    Values that cannot be cast, such as empty strings, become NULL.
+
+    Args:
+        table (str): The name of the table in SCHEMAS.
+        columns (list[str], optional): The columns to select, all columns if None.
+
+    Returns:
+        str: A comma separated select list.
+
+    Raises:
+        KeyError: If the table or a column is not declared in SCHEMAS.
+    """
+    schema = SCHEMAS[table]
+    columns = list(schema) if columns is None else columns
+    return ", ".join(
+        f"TRY_CAST({quote_identifier(col)} AS {schema[col]}) AS {quote_identifier(col)}"
+        for col in columns
+    )
+
+
+def typed_table(
+    con: DuckDBPyConnection, table: str, columns: Optional[List[str]] = None
+) -> DuckDBPyRelation:
+    """
+    Returns a lazy relation of a table with only the given columns, cast to their declared types.
+
+    Nothing is read until the relation is materialized, and the projection and casts
+    are executed by DuckDB, so only the selected columns are ever parsed.
+
+    Args:
+        con (DuckDBPyConnection): The DuckDB connection object.
+        table (str): The name of the table in SCHEMAS.
+        columns (list[str], optional): The columns to select, all columns if None.
+
+    Returns:
+        DuckDBPyRelation: The typed relation.
+
+    Example:
+        >>> matches = typed_table(con, "Match", ["id", "date", "home_team_api_id"])
+        >>> to_frame(matches.filter("date >= '2015-01-01'"))
+    """
+    return con.sql(f"SELECT {typed_columns(table, columns)} FROM {table}")
+
+
+def compact_table(
+    con: DuckDBPyConnection, table: str, columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Loads a table with compact column types, see compact_attributes.
+
+    The doubles are cast to FLOAT and the timestamps to day numbers by DuckDB, so no
+    float64 or datetime copy of the table is materialized on the way.
+
+    Args:
+        con (DuckDBPyConnection): The DuckDB connection object.
+        table (str): The name of the table in SCHEMAS, e.g. 'Player_Attributes'.
+        columns (list[str], optional): The columns to select, all columns if None.
+
+    Returns:
+        DataFrame: The table with categorical, int16, float32 and int32 columns, and
+        int32 day numbers for dates.
+
+    Example:
+        >>> player_attr = compact_table(con, "Player_Attributes")
+        >>> teams = Team.from_data(compact_table(con, "Team_Attributes"))
+    """
+    schema = SCHEMAS[table]
+    columns = list(schema) if columns is None else columns
+    selected, date_cols = [], []
+    for col in columns:
+        value = f"TRY_CAST({quote_identifier(col)} AS {schema[col]})"
+        if schema[col] == "DOUBLE":
+            value = f"CAST({value} AS FLOAT)"
+        elif schema[col] == "TIMESTAMP":
+            value = (
+                f"COALESCE(CAST(date_diff('day', DATE '1970-01-01', CAST({value} AS DATE))"
+                f" AS INTEGER), {MISSING_DAY})"
+            )
+            date_cols.append(col)
+        selected.append(f"{value} AS {quote_identifier(col)}")
+    data = con.sql(f"SELECT {', '.join(selected)} FROM {table}").df()
+    return compact_attributes(data, date_cols)
+
+
+def latest_entries_before(
+    con: DuckDBPyConnection,
+    table: str,
+    date: str,
+    columns: Optional[List[str]] = None,
+    id_name: str = "player_api_id",
+) -> DuckDBPyRelation:
+    """
+    Returns a lazy relation of the latest entry of every id strictly before a date.
+
+    Of several entries on the latest date, the one with the highest 'id' is returned,
+    as in AttributeIndex.
+
+    Args:
+        con (DuckDBPyConnection): The DuckDB connection object.
+        table (str): The name of an attribute table in SCHEMAS, e.g. 'Player_Attributes'.
+        date (str): The date to compare against in "YYYY-MM-DD" format.
+        columns (list[str], optional): The columns to select, all columns if None.
+        id_name (str, optional): The id column to take the latest entry of.
+
+    Returns:
+        DuckDBPyRelation: One typed row per id.
+    """
+    columns = list(SCHEMAS[table]) if columns is None else columns
+    order = ["date"] + (["id"] if "id" in SCHEMAS[table] else [])
+    keys = [col for col in [id_name] + order if col not in columns]
+    return con.sql(
+        f"""--sql
+        SELECT {", ".join(quote_identifier(col) for col in columns)}
+        FROM (SELECT {typed_columns(table, columns + keys)} FROM {table})
+        WHERE date < TIMESTAMP '{date}'
+        QUALIFY ROW_NUMBER() OVER (
+            PARTITION BY {quote_identifier(id_name)}
+            ORDER BY {", ".join(f"{quote_identifier(col)} DESC" for col in order)}
+        ) = 1
+        """
+    )
+
+
+def latest_entries_asof(
+    matches: DuckDBPyRelation,
+    table: str,
+    match_id_col: str,
+    columns: List[str],
+    id_name: str = "team_api_id",
+) -> DuckDBPyRelation:
+    """
+    Returns a lazy relation of the latest attribute entry strictly before every match.
+
+    This is the SQL equivalent of AttributeIndex.latest_entries, done with an ASOF join
+    so that only the selected attribute columns are read and cast. Entries on the same
+    date are reduced to the one with the highest 'id' first, as the ASOF join would
+    pick an arbitrary one of them.
+
+    Args:
+        matches (DuckDBPyRelation): A relation with 'id', 'date' and match_id_col columns,
+            e.g. from typed_table(con, "Match", ["id", "date", "home_team_api_id"]).
+        table (str): The name of an attribute table in SCHEMAS.
+        match_id_col (str): The column of matches with the ids to look up.
+        columns (list[str]): The attribute columns to return.
+        id_name (str, optional): The id column of the attribute table.
+
+    Returns:
+        DuckDBPyRelation: The match 'id' and the attribute columns, NULL where there is
+        no entry before the match.
+    """
+    selected = ", ".join(f"a.{quote_identifier(col)}" for col in columns)
+    if "id" in SCHEMAS[table]:
+        typed = typed_columns(table, ["id", id_name, "date"] + columns)
+        entries = f"""
+            SELECT * EXCLUDE (id) FROM (SELECT {typed} FROM {table})
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY {quote_identifier(id_name)}, date ORDER BY id DESC
+            ) = 1
+            """
+    else:
+        typed = typed_columns(table, [id_name, "date"] + columns)
+        entries = f"SELECT {typed} FROM {table}"
+    return matches.query(
+        "matches",
+        f"""--sql
+        SELECT m.id, {selected}
+        FROM matches m
+        ASOF LEFT JOIN ({entries}) a
+        ON m.{quote_identifier(match_id_col)} = a.{quote_identifier(id_name)}
+        AND m.date > a.date
+        ORDER BY m.id
+        """,
+    )
+
+
+def iter_batches(
+    con: DuckDBPyConnection,
+    table: str,
+    columns: Optional[List[str]] = None,
+    batch_size: int = 100_000,
+    where: Optional[str] = None,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Streams a table as typed Arrow record batches.
+
+    DuckDB executes the query in a streaming fashion, so only about one batch is held
+    in memory at a time, however large the table is.
+
+    Args:
+        con (DuckDBPyConnection): The DuckDB connection object.
+        table (str): The name of the table in SCHEMAS.
+        columns (list[str], optional): The columns to select, all columns if None.
+        batch_size (int, optional): The number of rows per batch.
+        where (str, optional): A filter expression on the typed columns.
+
+    Yields:
+        pa.RecordBatch: The rows of the table, batch_size at a time.
+
+    Example:
+        >>> for batch in iter_batches(con, "Match", MATCH_FEATURE_COLUMNS, 50_000):
+        ...     print(batch.num_rows)
+    """
+    relation = typed_table(con, table, columns)
+    if where is not None:
+        relation = relation.filter(where)
+    reader = relation.fetch_record_batch(batch_size)
+    while True:
+        try:
+            yield reader.read_next_batch()
+        except StopIteration:
+            return
+
+
+def to_frame(relation: DuckDBPyRelation) -> pd.DataFrame:
+    """
+    Materializes a relation as an Arrow backed pandas DataFrame.
+
+    Args:
+        relation (DuckDBPyRelation): The relation to materialize.
+
+    Returns:
+        DataFrame: The result, with pyarrow dtypes.
+    """
+    return relation.fetch_arrow_table().to_pandas(types_mapper=pd.ArrowDtype)
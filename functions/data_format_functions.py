@@ -1,9 +1,374 @@
+import json
+from typing import Any, Dict, List, Optional
+
 import numpy as np
+import pandas as pd
+
+
+def scale_num(num, min_input, max_input, min_output, max_output, out=None):
+    """
+    Linearly scales numbers from an input range to an output range.
+
+    Every argument may be a scalar or an array, and arrays are broadcast against each
+    other, e.g. (n, 2) coordinates with ranges of shape (2,) scale X and Y at once.
+
+    Args:
+        num: The numbers to scale.
+        min_input: The lower bound of the input range.
+        max_input: The upper bound of the input range.
+        min_output: The value min_input is mapped to.
+        max_output: The value max_input is mapped to.
+        out (np.ndarray, optional): A float array to write the result to, e.g. num
+            itself to scale it in place without allocating temporary arrays.
+
+    Returns:
+        The scaled numbers, out if it is given.
+
+    Example:
+        >>> scale_num(6, 1, 11, 0, 80)
+        40.0
+        >>> positions = np.array([[1.0, 1.0], [6.0, 11.0]])
+        >>> scale_num(positions, 1, 11, [0, 0], [80, 100], out=positions)
+    """
+    if out is None:
+        scaled_num = ((num - min_input) / (max_input - min_input)) * (
+            max_output - min_output
+        ) + min_output
+        return scaled_num
+
+    np.subtract(num, min_input, out=out)
+    np.divide(out, np.subtract(max_input, min_input), out=out)
+    np.multiply(out, np.subtract(max_output, min_output), out=out)
+    np.add(out, min_output, out=out)
+    return out
+
+
+# Day numbers count the days since 1970-01-01, and this one marks a missing date
+MISSING_DAY = np.iinfo(np.int32).min
+
+
+def day_numbers(dates) -> np.ndarray:
+    """
+    Converts dates to int32 day numbers, the days since 1970-01-01.
+
+    Args:
+        dates: A scalar or array-like of dates or "YYYY-MM-DD" strings.
+
+    Returns:
+        np.ndarray: The day numbers, MISSING_DAY where a date is missing.
+
+    Example:
+        >>> day_numbers(["1970-01-02", "2016-05-25"])
+        array([    1, 16946], dtype=int32)
+    """
+    dates = pd.to_datetime(np.atleast_1d(np.asarray(dates)))
+    days = np.asarray(dates.values.astype("datetime64[D]")).view("int64").copy()
+    days[np.asarray(dates.isna())] = MISSING_DAY
+    return days.astype(np.int32)
+
+
+def dates_from_day_numbers(days) -> pd.DatetimeIndex:
+    """
+    Converts day numbers back to dates.
+
+    Args:
+        days (array-like): Day numbers from day_numbers.
+
+    Returns:
+        DatetimeIndex: The dates, NaT where the day number is MISSING_DAY.
+    """
+    days = np.atleast_1d(np.asarray(days, dtype=np.int64))
+    dates = (days * 86_400_000_000_000).view("datetime64[ns]")
+    return pd.DatetimeIndex(np.where(days == MISSING_DAY, np.datetime64("NaT"), dates))
+
+
+def compact_attributes(
+    data: pd.DataFrame, date_cols: List[str] = ("date",)
+) -> pd.DataFrame:
+    """
+    Converts an attribute table to compact column types.
+
+    - Text columns whose values are all numbers, as loaded with sqlite_all_varchar,
+      are converted to numbers first.
+    - Other text columns, e.g. 'preferred_foot' or 'buildUpPlaySpeedClass', become
+      categoricals, i.e. small integer codes into a dictionary of their values.
+    - Numeric columns become int16 when every value is a whole number from 0 to 255,
+      as in complete rating columns. Other float columns become float32, keeping NaN,
+      and other integer columns, e.g. ids, become int32 when their values fit.
+    - The date_cols and datetime columns become int32 day numbers, see day_numbers.
+
+    Team, MatchPlayers, AttributeIndex and pandas crosstabs work on the compact table
+    as they do on the original one. The rating columns are signed and wide enough for
+    differences and sums of ratings, e.g. home minus away team ratings, so they do not
+    wrap around.
+
+    Args:
+        data (DataFrame): The attribute table, e.g. Player_Attributes or Team_Attributes.
+        date_cols (list[str], optional): The columns to store as day numbers.
+
+    Returns:
+        DataFrame: The compact table, with the same index and columns.
+
+    Example:
+        >>> player_attr = compact_attributes(player_attr_raw)
+        >>> pd.crosstab(player_attr["preferred_foot"], player_attr["attacking_work_rate"])
+    """
+    columns = {}
+    for col in data.columns:
+        values = data[col]
+        if col in date_cols or pd.api.types.is_datetime64_any_dtype(values):
+            if not pd.api.types.is_integer_dtype(values):
+                values = pd.Series(day_numbers(values), index=data.index)
+            columns[col] = values.astype(np.int32)
+            continue
+
+        if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            # Only the distinct values are parsed, through the dictionary encoding
+            categorical = values.astype("category")
+            numbers = pd.to_numeric(
+                pd.Series(categorical.cat.categories), errors="coerce"
+            ).to_numpy(dtype=np.float64)
+            if len(numbers) == 0 or np.isnan(numbers).any():
+                columns[col] = categorical
+                continue
+            codes = categorical.cat.codes.to_numpy()
+            array = numbers[codes]
+            if (codes >= 0).all() and (array == np.round(array)).all():
+                values = pd.Series(array.astype(np.int64), index=data.index)
+            else:
+                values = pd.Series(np.where(codes >= 0, array, np.nan), index=data.index)
+
+        if pd.api.types.is_bool_dtype(values) or isinstance(
+            values.dtype, pd.CategoricalDtype
+        ):
+            columns[col] = values
+        elif pd.api.types.is_integer_dtype(values):
+            low, high = (values.min(), values.max()) if len(values) else (0, 0)
+            if low >= 0 and high <= 255:
+                columns[col] = values.astype(np.int16)
+            elif low >= np.iinfo(np.int32).min and high <= np.iinfo(np.int32).max:
+                columns[col] = values.astype(np.int32)
+            else:
+                columns[col] = values
+        elif pd.api.types.is_float_dtype(values):
+            array = values.to_numpy(dtype=np.float64)
+            whole = (
+                np.isfinite(array).all()
+                and (array == np.round(array)).all()
+                and (len(array) == 0 or (array.min() >= 0 and array.max() <= 255))
+            )
+            columns[col] = values.astype(np.int16 if whole else np.float32)
+        else:
+            columns[col] = values
+    return pd.DataFrame(columns, index=data.index)
+
+
+class FeatureScaler:
+    """
+    Standardizes features to zero mean and unit variance with statistics fitted in one pass.
+
+    The means and variances are accumulated per batch and merged, so the data is read
+    once, batches can be added with partial_fit, and missing values are ignored per
+    column. The variance is the population variance, as in sklearn's StandardScaler,
+    and columns without variance are only centered. The fitted statistics can be saved
+    as JSON, so the scaler fitted on a training split can be reused to transform the
+    test split and any later batch instead of being refitted.
+
+    Attributes:
+        columns (list[str]): The column names of fitted DataFrames, None for arrays.
+        count (np.ndarray): The number of non-missing values of every column.
+        mean (np.ndarray): The mean of every column.
+        m2 (np.ndarray): The sum of squared deviations from the mean of every column.
+
+    Methods:
+        partial_fit(data) -> FeatureScaler: Adds a batch to the fitted statistics.
+        fit(data) -> FeatureScaler: Fits the statistics from scratch.
+        transform(data, out=None): Standardizes data with the fitted statistics.
+        fit_transform(data): Fits the statistics and standardizes data.
+        inverse_transform(data): Reverts transform.
+        to_dict() -> dict / from_dict(state) -> FeatureScaler: Converts to and from a dict.
+        save(path) -> None / load(path) -> FeatureScaler: Saves to and loads from JSON.
+
+    Example:
+        >>> scaler = FeatureScaler().fit(X_train)
+        >>> X_train_scaled = scaler.transform(X_train)
+        >>> X_test_scaled = scaler.transform(X_test)
+        >>> scaler.save("scaler.json")
+    """
+
+    def __init__(self):
+        self.columns: Optional[List[str]] = None
+        self.count: np.ndarray = None
+        self.mean: np.ndarray = None
+        self.m2: np.ndarray = None
+
+    @property
+    def variance(self) -> np.ndarray:
+        """The population variance of every column."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 0, self.m2 / self.count, np.nan)
+
+    @property
+    def scale(self) -> np.ndarray:
+        """The standard deviation of every column, 1 where it is 0 or unknown."""
+        std = np.sqrt(self.variance)
+        return np.where((std > 0) & np.isfinite(std), std, 1.0)
+
+    def _values(self, data) -> np.ndarray:
+        """Returns the values of data as a 2-D array, in the order of the fitted columns."""
+        if isinstance(data, pd.DataFrame):
+            if self.columns is not None:
+                data = data[self.columns]
+            return data.to_numpy(dtype=np.float64)
+        values = np.asarray(data, dtype=np.float64)
+        return values.reshape(len(values), -1)
+
+    def partial_fit(self, data) -> "FeatureScaler":
+        """
+        Adds a batch of rows to the fitted statistics.
+
+        Args:
+            data (DataFrame or array-like): A batch of shape (n_rows, n_features). The
+                columns of DataFrames are matched by name after the first batch.
+
+        Returns:
+            FeatureScaler: The scaler itself.
+        """
+        if self.count is None and isinstance(data, pd.DataFrame):
+            self.columns = list(data.columns)
+        values = self._values(data)
+
+        present = ~np.isnan(values)
+        count = present.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, np.nansum(values, axis=0) / count, 0.0)
+        m2 = np.nansum((values - mean) ** 2, axis=0)
+
+        if self.count is None:
+            self.count, self.mean, self.m2 = count, mean, m2
+            return self
+
+        # Merge the batch statistics with the fitted ones (Chan et al.)
+        total = self.count + count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = mean - self.mean
+            weight = np.where(total > 0, count / total, 0.0)
+            self.mean = self.mean + delta * weight
+            self.m2 = self.m2 + m2 + delta**2 * self.count * weight
+        self.count = total
+        return self
+
+    def fit(self, data) -> "FeatureScaler":
+        """
+        Fits the statistics from scratch.
+
+        Args:
+            data (DataFrame or array-like): The data of shape (n_rows, n_features).
+
+        Returns:
+            FeatureScaler: The scaler itself.
+        """
+        self.columns = self.count = self.mean = self.m2 = None
+        return self.partial_fit(data)
+
+    def transform(self, data, out: Optional[np.ndarray] = None):
+        """
+        Standardizes data with the fitted statistics.
+
+        Args:
+            data (DataFrame or array-like): The data of shape (n_rows, n_features).
+            out (np.ndarray, optional): A float array of the shape of data to write the
+                result to, e.g. data itself to standardize an array in place.
+
+        Returns:
+            DataFrame or np.ndarray: The standardized data, a DataFrame with the fitted
+            columns and the index of data if data is a DataFrame.
+        """
+        if out is not None and not isinstance(data, pd.DataFrame):
+            np.subtract(data, self.mean, out=out)
+            return np.divide(out, self.scale, out=out)
+
+        scaled = (self._values(data) - self.mean) / self.scale
+        if isinstance(data, pd.DataFrame):
+            return pd.DataFrame(
+                scaled, index=data.index, columns=self.columns or data.columns
+            )
+        return scaled
+
+    def fit_transform(self, data):
+        """
+        Fits the statistics and standardizes data.
+
+        Args:
+            data (DataFrame or array-like): The data of shape (n_rows, n_features).
+
+        Returns:
+            DataFrame or np.ndarray: The standardized data.
+        """
+        return self.fit(data).transform(data)
+
+    def inverse_transform(self, data):
+        """
+        Reverts transform.
+
+        Args:
+            data (DataFrame or array-like): Standardized data.
+
+        Returns:
+            DataFrame or np.ndarray: The data in the original units.
+        """
+        values = np.asarray(data, dtype=np.float64) * self.scale + self.mean
+        if isinstance(data, pd.DataFrame):
+            return pd.DataFrame(values, index=data.index, columns=data.columns)
+        return values
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the fitted statistics as a JSON serializable dict."""
+        return {
+            "columns": self.columns,
+            "count": self.count.tolist(),
+            "mean": self.mean.tolist(),
+            "m2": self.m2.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "FeatureScaler":
+        """
+        Creates a scaler from the statistics returned by to_dict.
+
+        Args:
+            state (dict): The fitted statistics.
+
+        Returns:
+            FeatureScaler: The fitted scaler.
+        """
+        scaler = cls()
+        scaler.columns = state["columns"]
+        scaler.count = np.asarray(state["count"], dtype=np.int64)
+        scaler.mean = np.asarray(state["mean"], dtype=np.float64)
+        scaler.m2 = np.asarray(state["m2"], dtype=np.float64)
+        return scaler
+
+    def save(self, path: str) -> None:
+        """
+        Saves the fitted statistics as JSON.
+
+        Args:
+            path (str): The JSON file to write.
+        """
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file)
 
+    @classmethod
+    def load(cls, path: str) -> "FeatureScaler":
+        """
+        Loads a scaler saved with save.
 
-def scale_num(num, min_input, max_input, min_output, max_output):
-    scaled_num = ((num - min_input) / (max_input - min_input)) * (
-        max_output - min_output
-    ) + min_output
+        Args:
+            path (str): The JSON file to read.
 
-    return scaled_num
+        Returns:
+            FeatureScaler: The fitted scaler.
+        """
+        with open(path) as file:
+            return cls.from_dict(json.load(file))
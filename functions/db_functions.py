@@ -1,20 +1,65 @@
+import hashlib
+import os
 from duckdb import DuckDBPyConnection
-from IPython.display import display, Markdown
-from tabulate import tabulate
 import pandas as pd
+from typing import Dict, Iterable, List, Sequence, Tuple
 
+from functions.data_access_functions import quote_identifier, typed_columns
+from functions.instrumentation_functions import instrument
 
-def check_db_nulls(con: DuckDBPyConnection, table: str, row_limit: int = 5) -> None:
+# The attribute tables that snapshots are cached of, with their snapshot name and id
+SNAPSHOT_SOURCES = {
+    "player": ("Player_Attributes", "player_api_id"),
+    "team": ("Team_Attributes", "team_api_id"),
+}
+
+
+def null_count_query(table: str, columns: List[str]) -> str:
+    """
+    Builds a query that counts the rows and the nulls of every column in a single scan.
+
+    Args:
+        table (str): The name of the table.
+        columns (list[str]): The columns to count nulls in.
+
+    Returns:
+        str: The query, returning a single row with a '_rows' column and one null count
+        column per table column.
+    """
+    counts = ",\n".join(
+        f"COUNT(*) - COUNT({quote_identifier(col)}) AS {quote_identifier(col)}"
+        for col in columns
+    )
+    return f"""--sql
+        SELECT COUNT(*) AS _rows,
+        {counts}
+        FROM {table}
+        """
+
+
+@instrument()
+def check_db_nulls(
+    con: DuckDBPyConnection,
+    table: str,
+    row_limit: int = 5,
+    display_results: bool = True,
+) -> pd.DataFrame:
     """
     Check for null values in a given SQLite table.
 
+    The null counts of all columns are computed in a single aggregated scan, and rows
+    with nulls are only fetched, up to row_limit per column, when they are displayed.
+
     Args:
         table (str): The name of the table to check for null values.
         con (DuckDBPyConnection): The DuckDB connection object.
         row_limit (int): The limit of rows with nulls to display.
+        display_results (bool): Whether to display the results as Markdown. Set to False
+            to only return the null counts, e.g. for automated data quality checks.
 
     Returns:
-        None
+        DataFrame: The 'null_count' and 'null_fraction' of every column, indexed by
+        column name.
 
     Raises:
         ValueError: If the specified table does not exist in the query result.
@@ -25,8 +70,6 @@ def check_db_nulls(con: DuckDBPyConnection, table: str, row_limit: int = 5) -> N
         No nulls in column_name Column
         Nulls found in column_name Column: [<resultset.Result at 0x7f6a811e6b80>]
     """
-    reserved_keywords = ["CROSS", "JOIN", "SELECT", "WHERE"]
-
     tables = (
         con.query(
             f"""--sql
@@ -49,35 +92,48 @@ GROUP BY table_name
             WHERE table_name = '{table}'"""
         )
         .to_df()["column_name"]
-        .values
+        .to_list()
     )
 
-    for col in table_columns:
-        if col.upper() in reserved_keywords:
-            col = f'"{col}"'
-        nulls = con.query(
-            f"""--sql
-                SELECT * FROM {table}
-                WHERE {col} IS NULL
-                """
-        )
-        if not nulls:
-            display(Markdown(f"No nulls in {col} Column"))
-        else:
-            nulls = nulls.to_df()
-            display(Markdown(f"{str(len(nulls))} null rows found in {col}:"))
-            display(
-                Markdown(
-                    tabulate(
-                        nulls[:row_limit],
-                        showindex=False,
-                        headers="keys",
-                        tablefmt="pipe",
+    counts = con.query(null_count_query(table, table_columns)).to_df()
+    total_rows = int(counts.pop("_rows").iloc[0])
+    null_counts = pd.DataFrame(
+        {"null_count": counts.iloc[0].astype(int).to_numpy()},
+        index=pd.Index(table_columns, name="column"),
+    )
+    null_counts["null_fraction"] = null_counts["null_count"] / max(total_rows, 1)
+
+    if display_results:
+        from IPython.display import display, Markdown
+        from tabulate import tabulate
+
+        for col, null_count in null_counts["null_count"].items():
+            if not null_count:
+                display(Markdown(f"No nulls in {col} Column"))
+                continue
+            display(Markdown(f"{null_count} null rows found in {col}:"))
+            if row_limit > 0:
+                nulls = con.query(
+                    f"""--sql
+                    SELECT * FROM {table}
+                    WHERE {quote_identifier(col)} IS NULL
+                    LIMIT {int(row_limit)}
+                    """
+                ).to_df()
+                display(
+                    Markdown(
+                        tabulate(
+                            nulls,
+                            showindex=False,
+                            headers="keys",
+                            tablefmt="pipe",
+                        )
                     )
                 )
-            )
+    return null_counts
 
 
+@instrument()
 def check_db_refs(
     con: DuckDBPyConnection,
     tab1: str,
@@ -108,36 +164,34 @@ def check_db_refs(
         All entries in table 1 are referenced in table 2
         Nulls found in key_name Column: [<resultset.Result at 0x7f6a811e6b80>]
     """
+    from IPython.display import display, Markdown
+    from tabulate import tabulate
+
     if not key_name2:
         key_name2 = key_name
 
-    nulls = con.query(
+    vals = con.query(
         f"""--sql
         SELECT DISTINCT p.{key_name}
         FROM {tab1} p
         LEFT JOIN {tab2} pa ON p.{key_name} = pa.{key_name2}
         WHERE pa.{key_name2} IS NULL
         """
-    )
-    if not nulls:
+    ).to_df()
+    if len(vals) == 0:
         display(Markdown(f"All entries in {tab1} are referenced in {tab2}."))
     else:
-        vals = con.query(
-            f"""--sql
-        SELECT DISTINCT p.{key_name}
-        FROM {tab1} p
-        LEFT JOIN {tab2} pa ON p.{key_name} = pa.{key_name2}
-        WHERE pa.{key_name2} IS NULL
-        """
-        ).to_df()
         if vals.isna().any().any():
             raise ValueError(f"Key {key_name} is missing from some entries in {tab1}.")
 
         missing_entries = con.query(
             f"""--sql
           SELECT *
-          FROM {tab1}
-          WHERE {key_name} IN ({", ".join(vals[key_name].values.tolist())})
+          FROM {tab1} p
+          WHERE NOT EXISTS (
+            SELECT 1 FROM {tab2} pa WHERE pa.{key_name2} = p.{key_name}
+          )
+          LIMIT {int(row_limit)}
           """
         ).to_df()
 
@@ -149,10 +203,304 @@ def check_db_refs(
         display(
             Markdown(
                 tabulate(
-                    missing_entries[:row_limit],
+                    missing_entries,
                     showindex=False,
                     headers="keys",
                     tablefmt="pipe",
                 )
             )
         )
+
+
+def relation_query(
+    child_table: str,
+    child_keys: List[str],
+    parent_table: str,
+    parent_key: str,
+    row_limit: int = 5,
+) -> str:
+    """
+    Builds a query that checks several key columns of one table against the key of another.
+
+    The key columns are unpivoted in a single scan of the child table and anti-joined
+    against the distinct parent keys, so the counts and samples of all columns come
+    back from one query.
+
+    Args:
+        child_table (str): The name of the referencing table.
+        child_keys (list[str]): The referencing key columns.
+        parent_table (str): The name of the referenced table.
+        parent_key (str): The referenced key column.
+        row_limit (int): The number of unreferenced keys to sample per column.
+
+    Returns:
+        str: The query, returning one row per child key column.
+    """
+    def literal(name: str) -> str:
+        return "'" + name.replace("'", "''") + "'"
+
+    names = ", ".join(literal(key) for key in child_keys)
+    keys = ", ".join(quote_identifier(key) for key in child_keys)
+    return f"""--sql
+        SELECT {literal(child_table)} AS child_table,
+            child_key,
+            {literal(parent_table)} AS parent_table,
+            {literal(parent_key)} AS parent_key,
+            COUNT(*) FILTER (WHERE k IS NULL) AS null_count,
+            COUNT(*) FILTER (WHERE k IS NOT NULL AND _parent_key IS NULL) AS orphan_rows,
+            COUNT(DISTINCT k) FILTER (WHERE _parent_key IS NULL) AS orphan_keys,
+            (list(DISTINCT CAST(k AS VARCHAR))
+                FILTER (WHERE k IS NOT NULL AND _parent_key IS NULL))[1:{int(row_limit)}]
+                AS sample
+        FROM (
+            SELECT UNNEST([{names}]) AS child_key, UNNEST([{keys}]) AS k
+            FROM {quote_identifier(child_table)}
+        ) c
+        LEFT JOIN (
+            SELECT DISTINCT {quote_identifier(parent_key)} AS _parent_key
+            FROM {quote_identifier(parent_table)}
+        ) p ON c.k = p._parent_key
+        GROUP BY child_key
+        """
+
+
+def relation_groups(
+    relations: Iterable[Tuple[str, str, str, str]],
+) -> Dict[Tuple[str, str, str], List[str]]:
+    """
+    Groups relations that can be checked in one scan of the child table.
+
+    Args:
+        relations (iterable[tuple]): (child_table, child_key, parent_table, parent_key)
+            tuples.
+
+    Returns:
+        dict: The distinct child keys of every (child_table, parent_table, parent_key)
+        group, so that a relation listed twice is only counted once.
+    """
+    groups: Dict[Tuple[str, str, str], List[str]] = {}
+    for child_table, child_key, parent_table, parent_key in relations:
+        keys = groups.setdefault((child_table, parent_table, parent_key), [])
+        if child_key not in keys:
+            keys.append(child_key)
+    return groups
+
+
+def relation_results(
+    results: List[pd.DataFrame], relations: Sequence[Tuple[str, str, str, str]]
+) -> pd.DataFrame:
+    """
+    Combines the results of relation queries into one row per relation.
+
+    Args:
+        results (list[DataFrame]): The results of relation_query.
+        relations (sequence[tuple]): The checked relations.
+
+    Returns:
+        DataFrame: One row per relation, in the order of relations. Relations of an
+        empty child table, for which the queries return no rows, have zero counts and
+        an empty sample.
+    """
+    order = pd.MultiIndex.from_tuples(
+        list(relations),
+        names=["child_table", "child_key", "parent_table", "parent_key"],
+    )
+    counts = ["null_count", "orphan_rows", "orphan_keys"]
+    if not results:
+        results = [pd.DataFrame(columns=order.names + counts + ["sample"])]
+    checks = pd.concat(results).set_index(order.names).reindex(order).reset_index()
+    missing = checks["sample"].isna()
+    checks[counts] = checks[counts].fillna(0).astype(int)
+    checks["sample"] = [
+        [] if empty else sample for sample, empty in zip(checks["sample"], missing)
+    ]
+    return checks
+
+
+@instrument()
+def check_db_relations(
+    con: DuckDBPyConnection,
+    relations: List[Tuple[str, str, str, str]],
+    row_limit: int = 5,
+    display_results: bool = True,
+) -> pd.DataFrame:
+    """
+    Check the referential integrity of several relations with a single query.
+
+    Relations with the same child and parent table are checked in one scan of the
+    child table, e.g. all 22 player columns of Match against Player.
+
+    Args:
+        con (DuckDBPyConnection): The DuckDB connection object.
+        relations (list[tuple]): (child_table, child_key, parent_table, parent_key)
+            tuples, where every child_key value should exist as a parent_key value.
+        row_limit (int): The number of unreferenced keys to sample per relation.
+        display_results (bool): Whether to display the results as Markdown.
+
+    Returns:
+        DataFrame: One row per relation, in the given order, with the number of null
+        keys ('null_count'), unreferenced rows ('orphan_rows') and distinct unreferenced
+        keys ('orphan_keys'), and a 'sample' of unreferenced keys. The counts are zero
+        for an empty child table.
+
+    Examples:
+        >>> relations = [
+        ...     ("Match", f"home_player_{i}", "Player", "player_api_id")
+        ...     for i in range(1, 12)
+        ... ]
+        >>> check_db_relations(connection, relations)
+    """
+    query = "\nUNION ALL\n".join(
+        relation_query(child_table, child_keys, parent_table, parent_key, row_limit)
+        for (child_table, parent_table, parent_key), child_keys in relation_groups(
+            relations
+        ).items()
+    )
+    results = relation_results([con.query(query).to_df()], relations)
+
+    if display_results:
+        from IPython.display import display, Markdown
+
+        for relation in results.itertuples():
+            if relation.null_count:
+                display(
+                    Markdown(
+                        f"{relation.null_count} entries in {relation.child_table} have no {relation.child_key}."
+                    )
+                )
+            if not relation.orphan_keys:
+                display(
+                    Markdown(
+                        f"All {relation.child_key} entries in {relation.child_table} are referenced in {relation.parent_table}."
+                    )
+                )
+            else:
+                display(
+                    Markdown(
+                        f"{relation.orphan_keys} {relation.child_key} values from {relation.child_table} were found to be unreferenced in {relation.parent_table}: "
+                        + ", ".join(relation.sample)
+                    )
+                )
+    return results
+
+
+def _file_hash(path: str, chunk_size: int = 2**20) -> str:
+    """Returns the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _season_expression(date_col: str) -> str:
+    """Builds an expression of the 'YYYY/YYYY' season of a date, with seasons starting in July."""
+    start = f"(year({date_col}) - CASE WHEN month({date_col}) < 7 THEN 1 ELSE 0 END)"
+    return f"CAST({start} AS VARCHAR) || '/' || CAST({start} + 1 AS VARCHAR)"
+
+
+def _snapshot_queries(alias: str) -> Dict[str, str]:
+    """Builds the queries that create the latest and per-season snapshot tables."""
+    queries = {}
+    for name, (table, id_name) in SNAPSHOT_SOURCES.items():
+        typed = f"SELECT {typed_columns(table)} FROM {table}"
+        queries[f"{name}_latest"] = f"""--sql
+            CREATE OR REPLACE TABLE {alias}.{name}_latest AS
+            SELECT * FROM ({typed})
+            WHERE {quote_identifier(id_name)} IS NOT NULL AND date IS NOT NULL
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY {quote_identifier(id_name)} ORDER BY date DESC, id DESC
+            ) = 1
+            ORDER BY {quote_identifier(id_name)}
+            """
+        queries[f"{name}_season"] = f"""--sql
+            CREATE OR REPLACE TABLE {alias}.{name}_season AS
+            SELECT {_season_expression("date")} AS season, *
+            FROM ({typed})
+            WHERE {quote_identifier(id_name)} IS NOT NULL AND date IS NOT NULL
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY {quote_identifier(id_name)}, season
+                ORDER BY date DESC, id DESC
+            ) = 1
+            ORDER BY season, {quote_identifier(id_name)}
+            """
+    return queries
+
+
+def attach_snapshot_cache(
+    con: DuckDBPyConnection,
+    source_path: str,
+    cache_path: str,
+    alias: str = "snapshots",
+    force: bool = False,
+) -> Dict[str, str]:
+    """
+    Attaches a persistent cache of typed attribute snapshots, building it when it is stale.
+
+    For both Player_Attributes and Team_Attributes, the cache holds the latest entry of
+    every id ('<name>_latest') and the latest entry of every id in every season
+    ('<name>_season'), cast with the types in SCHEMAS. Analyses that only need the
+    latest entries can query these small local tables instead of scanning the
+    attached SQLite tables as text every time.
+
+    The cache records the size, modification time and SHA-256 hash of the source file.
+    It is reused as is while the size and modification time match, and the file is
+    only hashed when they do not, so a copied or touched but unchanged file does not
+    trigger a rebuild.
+
+    Args:
+        con (DuckDBPyConnection): The DuckDB connection with the source tables attached.
+        source_path (str): The path of the source database file, e.g. the SQLite file.
+        cache_path (str): The path of the DuckDB cache file, created if it does not exist.
+        alias (str, optional): The name to attach the cache under.
+        force (bool, optional): Whether to rebuild the cache even if it is up to date.
+
+    Returns:
+        dict: The qualified name of every snapshot table, keyed by snapshot name.
+
+    Example:
+        >>> snapshots = attach_snapshot_cache(con, "data/database.sqlite", "data/cache.duckdb")
+        >>> con.query(f"SELECT preferred_foot, COUNT(*) FROM {snapshots['player_latest']} GROUP BY 1")
+    """
+    con.execute(f"ATTACH IF NOT EXISTS '{cache_path}' AS {alias}")
+    con.execute(
+        f"""--sql
+        CREATE TABLE IF NOT EXISTS {alias}._snapshot_source (
+            size BIGINT, mtime_ns BIGINT, sha256 VARCHAR, built_at TIMESTAMP
+        )
+        """
+    )
+    queries = _snapshot_queries(alias)
+    tables = {name: f"{alias}.{name}" for name in queries}
+
+    stat = os.stat(source_path)
+    stored = con.query(
+        f"SELECT size, mtime_ns, sha256 FROM {alias}._snapshot_source"
+    ).fetchone()
+    if not force and stored is not None:
+        if stored[:2] == (stat.st_size, stat.st_mtime_ns):
+            return tables
+        source_hash = _file_hash(source_path)
+        if stored[2] == source_hash:
+            con.execute(
+                f"UPDATE {alias}._snapshot_source SET size = ?, mtime_ns = ?",
+                [stat.st_size, stat.st_mtime_ns],
+            )
+            return tables
+    else:
+        source_hash = _file_hash(source_path)
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for query in queries.values():
+            con.execute(query)
+        con.execute(f"DELETE FROM {alias}._snapshot_source")
+        con.execute(
+            f"INSERT INTO {alias}._snapshot_source VALUES (?, ?, ?, current_timestamp)",
+            [stat.st_size, stat.st_mtime_ns, source_hash],
+        )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return tables
@@ -1,9 +1,12 @@
-from IPython.display import Markdown, display
-from typing import Optional
-import matplotlib.pyplot as plt
+from typing import TYPE_CHECKING, Optional
 import pandas as pd
 import numpy as np
 
+# matplotlib and IPython are only imported where they are used, so that the
+# numeric helpers can be imported by workers without a display stack
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
 
 def sized_markdown(text: str, font_size: int = 14) -> None:
     """
@@ -21,11 +24,13 @@ def sized_markdown(text: str, font_size: int = 14) -> None:
         sized_markdown("Hello, **ChatGPT**!", font_size=20)
         # This will display the text "Hello, with a font size of 20 pixels in a Markdown-styled format.
     """
+    from IPython.display import Markdown, display
+
     display(Markdown(f"<span style='font-size:{font_size}px;'>" + text))
 
 
 def axis_titles(
-    ax: plt.Axes,
+    ax: "plt.Axes",
     xtitle: Optional[str] = None,
     ytitle: Optional[str] = None,
     title: Optional[str] = None,
@@ -59,15 +64,57 @@ def axis_titles(
     ax.set_title(title)
 
 
+def _standardized_columns(data: pd.DataFrame, method: str) -> np.ndarray:
+    """
+    Returns the columns of data scaled so that their pairwise dot products divided by
+    (n - 1) are correlation coefficients. Rows with missing values are dropped, and
+    constant columns become NaN.
+    """
+    data = data.dropna()
+    if method == "spearman":
+        data = data.rank()
+    values = data.to_numpy(dtype=np.float64)
+    values = values - values.mean(axis=0)
+    std = values.std(axis=0, ddof=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return values / np.where(std > 0, std, np.nan)
+
+
 def get_correlation_pairs(
     data: pd.DataFrame,
     positive_cut_off: Optional[float] = 0,
     negative_cut_off: Optional[float] = 0,
     leave_center: bool = False,
+    method: str = "pearson",
+    chunk_size: Optional[int] = None,
+    split_features: bool = False,
 ) -> pd.DataFrame:
     """
     Produces a data frame that contains pairs of features
     and their r-values based on selected cut-offs
+
+    Pairs with r-values above positive_cut_off or below negative_cut_off are kept,
+    or only those in between if leave_center is True. A cut-off of None disables
+    that side. Every pair is taken once from the upper triangle of the correlation
+    matrix.
+
+    With chunk_size set, the correlations are computed chunk_size rows of the
+    correlation matrix at a time, so the full matrix is never held in memory. Rows
+    with missing values are then dropped from all columns, instead of pairwise.
+
+    Parameters:
+        data (pd.DataFrame): The data, of which only numeric columns are used.
+        positive_cut_off (Optional[float]): The positive cut-off between 0 and 1.
+        negative_cut_off (Optional[float]): The negative cut-off between -1 and 0.
+        leave_center (bool): Whether to keep the pairs between the cut-offs instead.
+        method (str): 'pearson' or 'spearman'.
+        chunk_size (Optional[int]): The number of correlation matrix rows per chunk.
+        split_features (bool): Whether to also return the two features of every pair
+            as 'feature_a' and 'feature_b' columns.
+
+    Returns:
+        pd.DataFrame: The 'r-value' and 'feature_pair' of every kept pair, preceded by
+        'feature_a' and 'feature_b' if split_features is True.
     """
     if positive_cut_off is not None and not 0 <= positive_cut_off <= 1:
         raise ValueError("Positive cut-offs must be between 0 and 1")
@@ -75,42 +122,60 @@ def get_correlation_pairs(
     if negative_cut_off is not None and not -1 <= negative_cut_off <= 0:
         raise ValueError("Negative cut-offs must be between -1 and 0")
 
-    corr_matrix = data.corr(numeric_only=True)
-
-    if not leave_center:
-        np.fill_diagonal(corr_matrix.values, None)
-
-        cut_correlation_matrix = corr_matrix.mask(
-            (corr_matrix >= negative_cut_off) & (corr_matrix <= positive_cut_off)
-        )
-
+    if method not in ("pearson", "spearman"):
+        raise ValueError("Method must be 'pearson' or 'spearman'")
+
+    upper = np.inf if positive_cut_off is None else positive_cut_off
+    lower = -np.inf if negative_cut_off is None else negative_cut_off
+
+    def keep(r_values: np.ndarray) -> np.ndarray:
+        if leave_center:
+            return (r_values > lower) & (r_values < upper)
+        return (r_values < lower) | (r_values > upper)
+
+    numeric = data.select_dtypes(include=["number", "bool"])
+    features = numeric.columns
+    pair_rows, pair_cols, r_values = [], [], []
+
+    if chunk_size is None:
+        corr_matrix = numeric.corr(method=method).to_numpy()
+        rows, cols = np.triu_indices(len(features), k=1)
+        r = corr_matrix[rows, cols]
+        kept = keep(r)
+        pair_rows.append(rows[kept])
+        pair_cols.append(cols[kept])
+        r_values.append(r[kept])
     else:
-        # Masking extreme negative values
-        cut_correlation_matrix = corr_matrix.mask(corr_matrix <= negative_cut_off)
-
-        # Masking extreme positive values
-        cut_correlation_matrix = cut_correlation_matrix.mask(
-            corr_matrix >= positive_cut_off
-        )
-
-    # stacking the remaining values
-    cut_correlation_matrix = cut_correlation_matrix.stack().reset_index()
-
-    # combining levels after stacking into a single pair frozenset
-    cut_correlation_matrix["feature_pair"] = cut_correlation_matrix[
-        ["level_0", "level_1"]
-    ].apply(frozenset, axis=1)
-
-    # dropping previous level columns
-    cut_correlation_matrix = cut_correlation_matrix.drop(columns=["level_0", "level_1"])
-
-    # removing duplicate pairs
-    cut_correlation_matrix = cut_correlation_matrix.drop_duplicates(
-        subset="feature_pair"
+        values = _standardized_columns(numeric, method)
+        n_rows = len(values)
+        for start in range(0, len(features), chunk_size):
+            stop = min(start + chunk_size, len(features))
+            block = values[:, start:stop].T @ values[:, start:] / (n_rows - 1)
+            rows, cols = np.nonzero(
+                np.arange(block.shape[1]) > np.arange(block.shape[0])[:, None]
+            )
+            r = block[rows, cols]
+            kept = keep(r)
+            pair_rows.append(rows[kept] + start)
+            pair_cols.append(cols[kept] + start)
+            r_values.append(r[kept])
+
+    rows = np.concatenate(pair_rows) if pair_rows else np.array([], dtype=int)
+    cols = np.concatenate(pair_cols) if pair_cols else np.array([], dtype=int)
+    correlation_pairs = pd.DataFrame(
+        {
+            "feature_a": features[rows],
+            "feature_b": features[cols],
+            "r-value": np.concatenate(r_values) if r_values else [],
+        }
     )
-
-    cut_correlation_matrix = cut_correlation_matrix.rename(columns={0: "r-value"})
-    return cut_correlation_matrix
+    correlation_pairs["feature_pair"] = [
+        frozenset(pair)
+        for pair in zip(correlation_pairs["feature_a"], correlation_pairs["feature_b"])
+    ]
+    if not split_features:
+        correlation_pairs = correlation_pairs.drop(columns=["feature_a", "feature_b"])
+    return correlation_pairs
 
 
 def rb_cell_highlight(value: float, threshold: float, higher: bool = True) -> str:
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from functions.project_functions_classes import AttributeIndex
+
+FINGERPRINT_COL = "_fingerprint"
+_FINGERPRINT_PRIME = np.uint64(1099511628211)
+
+
+def combine_fingerprints(*fingerprints: np.ndarray) -> np.ndarray:
+    """
+    Combines several per-match fingerprint arrays into one, in an order sensitive way.
+
+    Args:
+        *fingerprints (np.ndarray): uint64 arrays of shape (n_matches,) or (n_matches, m).
+
+    Returns:
+        np.ndarray: A uint64 array of shape (n_matches,).
+    """
+    combined = None
+    for fingerprint in fingerprints:
+        fingerprint = np.asarray(fingerprint, dtype=np.uint64)
+        columns = fingerprint.reshape(len(fingerprint), -1).T
+        for column in columns:
+            if combined is None:
+                combined = column.copy()
+            else:
+                combined = (combined * _FINGERPRINT_PRIME) ^ column
+    return combined
+
+
+def source_fingerprints(index: AttributeIndex, ids, dates) -> np.ndarray:
+    """
+    Fingerprints the attribute entries that feed the features of every match.
+
+    Every id is resolved to its latest entry before the match date, and the hashes
+    of those entries are combined per match, so the fingerprint only changes when
+    an entry the match depends on is added, removed or edited.
+
+    Args:
+        index (AttributeIndex): An index of the source attribute entries.
+        ids (array-like): The ids used by every match, of shape (n_matches, m), e.g.
+            the 22 player ids or the home and away team ids.
+        dates (array-like): The match dates, of shape (n_matches,).
+
+    Returns:
+        np.ndarray: A uint64 array of shape (n_matches,).
+    """
+    ids = np.asarray(ids, dtype=object)
+    ids = ids.reshape(len(ids), -1)
+    row_hashes = np.append(
+        pd.util.hash_pandas_object(index.data, index=False).to_numpy(), np.uint64(0)
+    )
+    positions = index.positions(ids.ravel(), np.repeat(np.asarray(dates), ids.shape[1]))
+    return combine_fingerprints(row_hashes[positions].reshape(ids.shape))
+
+
+class FeatureStore:
+    """
+    An on-disk store of match feature matrices, partitioned by season and keyed by match id.
+
+    Every partition is an Arrow IPC file holding the features of one season together
+    with the fingerprint of the inputs each match was built from. On a rebuild only the
+    matches whose fingerprint changed, and new matches, are recomputed. Everything else
+    is read back from the partition files, which are memory-mapped. A partition written
+    with another spec is discarded as a whole.
+
+    Attributes:
+        path (str): The directory of the store.
+        spec (dict): The feature specification, e.g. the attribute columns and export mode.
+            Changing it invalidates every stored partition.
+
+    Methods:
+        build(matches, fingerprints, builder, season_col='season') -> DataFrame:
+            Returns the features of the matches, recomputing only what changed.
+        load(seasons=None) -> DataFrame:
+            Returns the stored features of the given seasons.
+    """
+
+    def __init__(self, path: str, spec: Dict[str, Any]):
+        self.path = path
+        self.spec = spec
+        self._spec_json = json.dumps(spec, sort_keys=True, default=str)
+        digest = hashlib.sha256(self._spec_json.encode()).digest()
+        self._spec_hash = np.frombuffer(digest[:8], dtype=np.uint64)[0]
+        os.makedirs(path, exist_ok=True)
+
+    def _partition_path(self, season) -> str:
+        season = str(season).replace("/", "-")
+        return os.path.join(self.path, f"season={season}", "part-0.arrow")
+
+    def _read_partition(self, season) -> pd.DataFrame:
+        """Reads a stored partition, None if there is none or it has another spec."""
+        path = self._partition_path(season)
+        if not os.path.exists(path):
+            return None
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        if table.schema.metadata.get(b"spec", b"").decode() != self._spec_json:
+            return None
+        data = table.to_pandas(split_blocks=True)
+        return data.set_index(table.schema.metadata[b"index_name"].decode())
+
+    def _write_partition(self, season, data: pd.DataFrame) -> None:
+        path = self._partition_path(season)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Arrays are converted without from_pandas, so NaN stays NaN instead of
+        # becoming null and columns can be read back without copying
+        index_name = data.index.name or "match_id"
+        columns = {index_name: pa.array(data.index.to_numpy())}
+        for col in data.columns:
+            columns[col] = pa.array(data[col].to_numpy())
+        table = pa.table(columns).replace_schema_metadata(
+            {"index_name": index_name, "spec": self._spec_json}
+        )
+
+        temp_path = path + ".tmp"
+        with pa.OSFile(temp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temp_path, path)
+
+    def build(
+        self,
+        matches: pd.DataFrame,
+        fingerprints: np.ndarray,
+        builder: Callable[[pd.DataFrame], pd.DataFrame],
+        season_col: str = "season",
+    ) -> pd.DataFrame:
+        """
+        Returns the features of the given matches, recomputing only the matches whose inputs changed.
+
+        The matches may be a part of a season. The rebuilt matches are merged into the
+        stored partition, so the other stored matches of the season are kept.
+
+        Args:
+            matches (DataFrame): The matches indexed by match id.
+            fingerprints (np.ndarray): The uint64 input fingerprint of every match, e.g.
+                from source_fingerprints.
+            builder (Callable): A function that takes a subset of matches and returns
+                their features as a DataFrame indexed by match id.
+            season_col (str, optional): The column of matches containing the season.
+
+        Returns:
+            DataFrame: The features of the matches, in the order of matches.
+
+        Example:
+            >>> store = FeatureStore("features", {"cols": cols, "how": "all"})
+            >>> features = store.build(
+            ...     matches,
+            ...     source_fingerprints(player_index, player_ids, matches["date"]),
+            ...     lambda m: MatchLineupTensor.from_matches(
+            ...         m, player_index, cols
+            ...     ).export_player_attributes("all"),
+            ... )
+        """
+        fingerprints = pd.Series(
+            np.asarray(fingerprints, dtype=np.uint64) ^ self._spec_hash,
+            index=matches.index,
+        )
+        partitions: List[pd.DataFrame] = []
+
+        for season, season_matches in matches.groupby(season_col, sort=True):
+            season_fingerprints = fingerprints.loc[season_matches.index]
+            stored = self._read_partition(season)
+
+            changed = np.ones(len(season_matches), dtype=bool)
+            if stored is not None:
+                present = season_matches.index.isin(stored.index)
+                changed[present] = (
+                    stored.loc[season_matches.index[present], FINGERPRINT_COL]
+                    .to_numpy()
+                    != season_fingerprints.to_numpy()[present]
+                )
+
+            if changed.any():
+                built = builder(season_matches.loc[changed])
+                built[FINGERPRINT_COL] = season_fingerprints.loc[built.index]
+                if stored is not None:
+                    # Rebuilt matches replace their stored rows in place and new
+                    # matches are appended, other stored matches are kept
+                    order = stored.index.union(built.index, sort=False)
+                    built = pd.concat(
+                        [stored.drop(index=built.index, errors="ignore"), built]
+                    ).loc[order]
+                self._write_partition(season, built)
+                stored = built
+            partitions.append(stored.loc[season_matches.index])
+
+        features = pd.concat(partitions) if partitions else pd.DataFrame()
+        return features.reindex(matches.index).drop(columns=FINGERPRINT_COL)
+
+    def load(self, seasons=None) -> pd.DataFrame:
+        """
+        Returns the stored features of the given seasons.
+
+        Args:
+            seasons (list, optional): The seasons to load, all stored seasons if None.
+
+        Returns:
+            DataFrame: The stored features indexed by match id.
+        """
+        if seasons is None:
+            seasons = sorted(
+                name.split("=", 1)[1]
+                for name in os.listdir(self.path)
+                if name.startswith("season=")
+            )
+        partitions = [self._read_partition(season) for season in seasons]
+        partitions = [partition for partition in partitions if partition is not None]
+        if not partitions:
+            return pd.DataFrame()
+        return pd.concat(partitions).drop(columns=FINGERPRINT_COL)
@@ -0,0 +1,207 @@
+from math import comb
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from functions.data_format_functions import scale_num
+from functions.project_functions_classes import lineup_arrays
+
+# Lineup coordinates are integers on a grid, with X from 1 to 9 and Y from 1 to 11
+GRID_SIZE = 12
+N_PLAYERS = 11
+
+# Binomial coefficients C(n, k) of the combinatorial number system. The largest key,
+# C(144, 11) - 1, fits in an int64
+_BINOMIALS = np.array(
+    [[comb(n, k) for k in range(N_PLAYERS + 1)] for n in range(GRID_SIZE**2 + 1)],
+    dtype=np.int64,
+)
+
+
+def formation_keys(positions) -> np.ndarray:
+    """
+    Packs lineup coordinates into a canonical 64-bit formation key.
+
+    Every (X, Y) coordinate is a cell of the grid, and the set of 11 cells is ranked in
+    the combinatorial number system. The key therefore does not depend on the slot
+    order, is the same in every dataset and can be decoded back to the coordinates.
+    As with frozensets of the (X, Y) tuples, lineups with a missing coordinate or with
+    two players on the same cell have no formation.
+
+    Args:
+        positions (array-like): Coordinates of shape (..., 11, 2).
+
+    Returns:
+        np.ndarray: An int64 array of shape positions.shape[:-2], -1 where a lineup has
+        no formation.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    valid = (
+        np.isfinite(positions)
+        & (positions == np.round(positions))
+        & (positions >= 0)
+        & (positions < GRID_SIZE)
+    ).all(axis=(-2, -1))
+    cells = np.where(
+        valid[..., None],
+        np.nan_to_num(positions[..., 0]) * GRID_SIZE + np.nan_to_num(positions[..., 1]),
+        np.arange(N_PLAYERS),
+    ).astype(np.int64)
+    cells.sort(axis=-1)
+    valid &= (np.diff(cells, axis=-1) > 0).all(axis=-1)
+
+    keys = _BINOMIALS[cells, np.arange(1, N_PLAYERS + 1)].sum(axis=-1)
+    return np.where(valid, keys, -1)
+
+
+def decode_formation_keys(keys) -> np.ndarray:
+    """
+    Unpacks formation keys into lineup coordinates.
+
+    Args:
+        keys (array-like): Formation keys from formation_keys.
+
+    Returns:
+        np.ndarray: A float64 array of shape keys.shape + (11, 2), with the coordinates
+        sorted by X and then Y, and NaN for keys of -1.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    remainder = np.where(keys >= 0, keys, 0).ravel()
+    cells = np.empty((len(remainder), N_PLAYERS), dtype=np.int64)
+    for i in range(N_PLAYERS - 1, -1, -1):
+        cells[:, i] = np.searchsorted(_BINOMIALS[:, i + 1], remainder, "right") - 1
+        remainder = remainder - _BINOMIALS[cells[:, i], i + 1]
+
+    positions = np.stack([cells // GRID_SIZE, cells % GRID_SIZE], axis=-1)
+    positions = positions.reshape(keys.shape + (N_PLAYERS, 2)).astype(np.float64)
+    positions[keys < 0] = np.nan
+    return positions
+
+
+class FormationIndex:
+    """
+    A table of the lineup formations in a dataset, labelled by how common they are.
+
+    Formation 0 is the most common formation, formation 1 the second most common and so
+    on, with ties in the order the formations first appear, as with value_counts on
+    frozensets of the (X, Y) tuples. Counting, contingency tables and models can then
+    work with the integer labels.
+
+    Attributes:
+        keys (np.ndarray): The formation key of every label, see formation_keys.
+        counts (np.ndarray): The number of lineups with every formation.
+        formations (np.ndarray): The (X, Y) coordinates of every formation, of shape
+            (n_formations, 11, 2).
+
+    Methods:
+        from_positions(positions) -> FormationIndex:
+            Counts the formations of lineup coordinates.
+        from_matches(matches) -> FormationIndex:
+            Counts the home and away formations of the Match table.
+        encode(positions) -> np.ndarray:
+            Returns the formation label of every lineup.
+        scaled_formations(...) -> np.ndarray:
+            Returns the coordinates of every formation scaled to a pitch plot.
+        to_frozensets() -> list[frozenset]:
+            Returns every formation as a frozenset of (X, Y) tuples.
+    """
+
+    def __init__(self, keys: np.ndarray, counts: np.ndarray):
+        self.keys = keys
+        self.counts = counts
+        self.formations = decode_formation_keys(keys)
+        self._label_lookup = pd.Index(keys)
+
+    @classmethod
+    def from_positions(cls, positions) -> "FormationIndex":
+        """
+        Counts the formations of lineup coordinates.
+
+        Args:
+            positions (array-like): Coordinates of shape (..., 11, 2).
+
+        Returns:
+            FormationIndex: The formations ordered by count.
+        """
+        keys = formation_keys(positions).ravel()
+        keys = keys[keys >= 0]
+        unique_keys, first_index, counts = np.unique(
+            keys, return_index=True, return_counts=True
+        )
+        order = np.lexsort((first_index, -counts))
+        return cls(unique_keys[order], counts[order])
+
+    @classmethod
+    def from_matches(cls, matches: pd.DataFrame) -> "FormationIndex":
+        """
+        Counts the home and away formations of the Match table.
+
+        Args:
+            matches (DataFrame): The matches with 'home_player_X1' to 'away_player_Y11'
+                columns.
+
+        Returns:
+            FormationIndex: The formations ordered by count.
+        """
+        _, positions = lineup_arrays(matches)
+        return cls.from_positions(
+            np.concatenate([positions[:, 0], positions[:, 1]])
+        )
+
+    def encode(self, positions) -> np.ndarray:
+        """
+        Returns the formation label of every lineup.
+
+        Args:
+            positions (array-like): Coordinates of shape (..., 11, 2), e.g. the
+                (n_matches, 2, 11, 2) positions of MatchLineupTensor.
+
+        Returns:
+            np.ndarray: An int64 array of shape positions.shape[:-2], -1 where a lineup
+            has no formation or a formation that is not in the index.
+        """
+        keys = formation_keys(positions)
+        return self._label_lookup.get_indexer(keys.ravel()).reshape(keys.shape)
+
+    def scaled_formations(
+        self,
+        x_range: Tuple[float, float] = (8, 88),
+        y_range: Tuple[float, float] = (0, 100),
+        goalkeeper: Tuple[float, float] = (5, 1),
+    ) -> np.ndarray:
+        """
+        Returns the coordinates of every formation scaled to a pitch plot.
+
+        The goalkeeper at (1, 1) is first moved to the goalkeeper coordinate, and the
+        X and Y coordinates are then scaled from 1-11 to x_range and y_range. The
+        defaults are those of the formation pitch plots in the analysis.
+
+        Args:
+            x_range (tuple, optional): The scaled range of X.
+            y_range (tuple, optional): The scaled range of Y.
+            goalkeeper (tuple, optional): The coordinate the goalkeeper is moved to.
+
+        Returns:
+            np.ndarray: A float64 array of shape (n_formations, 11, 2).
+        """
+        is_goalkeeper = (self.formations == 1).all(axis=-1, keepdims=True)
+        formations = np.where(is_goalkeeper, goalkeeper, self.formations)
+        return np.stack(
+            [
+                scale_num(formations[..., 0], 1, 11, *x_range),
+                scale_num(formations[..., 1], 1, 11, *y_range),
+            ],
+            axis=-1,
+        )
+
+    def to_frozensets(self) -> List[frozenset]:
+        """
+        Returns every formation as a frozenset of (X, Y) tuples.
+
+        Returns:
+            list[frozenset]: The formations in label order.
+        """
+        return [
+            frozenset(map(tuple, formation.tolist())) for formation in self.formations
+        ]
@@ -0,0 +1,375 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Methods of DuckDB connections and relations that execute a query and fetch its result
+_FETCH_METHODS = {
+    "df",
+    "to_df",
+    "fetchdf",
+    "fetch_df",
+    "fetchall",
+    "fetchone",
+    "fetchmany",
+    "fetchnumpy",
+    "fetch_arrow_table",
+    "arrow",
+    "pl",
+    "fetch_record_batch",
+    "show",
+}
+
+# Methods of DuckDB connections that take a query and return a relation
+_QUERY_METHODS = {"query", "sql", "from_query", "execute", "executemany"}
+
+
+def _is_frame_like(obj: Any) -> bool:
+    """Returns whether an object is a pandas or numpy object, without importing either."""
+    return type(obj).__module__.split(".", 1)[0] in ("pandas", "numpy")
+
+
+def _rows(obj: Any) -> Optional[int]:
+    """Returns the number of rows of a pandas or numpy object, None for anything else."""
+    if _is_frame_like(obj) and getattr(obj, "ndim", 0) > 0:
+        return int(obj.shape[0])
+    return None
+
+
+def _nbytes(obj: Any) -> Optional[int]:
+    """Returns the memory size of a pandas or numpy object, None for anything else."""
+    if not _is_frame_like(obj):
+        return None
+    # Only DataFrame and Series take an index argument, an Index does not
+    if any(cls.__name__ in ("DataFrame", "Series") for cls in type(obj).__mro__):
+        usage = obj.memory_usage(index=True, deep=False)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if hasattr(obj, "memory_usage"):
+        return int(obj.memory_usage(deep=False))
+    return int(getattr(obj, "nbytes", 0))
+
+
+class MetricsRegistry:
+    """
+    An in-process registry of timed events, such as function calls and DuckDB queries.
+
+    Recording is off by default, and instrumented functions only check the enabled
+    flag before calling through, so instrumentation costs next to nothing when off.
+
+    Attributes:
+        enabled (bool): Whether events are recorded.
+        events (list[dict]): The recorded events, with a 'name', 'start_ns' and
+            'duration_ns', the 'rows_in', 'rows_out' and 'bytes_out' of pandas and numpy
+            arguments and results where known, and extra 'args' such as the SQL text.
+
+    Methods:
+        enable() -> None: Starts recording events.
+        disable() -> None: Stops recording events.
+        reset() -> None: Removes all recorded events.
+        record(...) -> None: Records an event.
+        summary() -> DataFrame: Aggregates the events per name.
+        to_table() -> str: Formats the summary as a table.
+        to_chrome_trace(path=None) -> dict: Exports the events in the Chrome trace format.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events: List[Dict[str, Any]] = []
+        self._origin_ns = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.events = []
+            self._origin_ns = time.perf_counter_ns()
+
+    def record(
+        self,
+        name: str,
+        start_ns: int,
+        end_ns: int,
+        rows_in: Optional[int] = None,
+        rows_out: Optional[int] = None,
+        bytes_out: Optional[int] = None,
+        args: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Records an event.
+
+        Args:
+            name (str): The name of the event, e.g. the qualified function name.
+            start_ns (int): The time.perf_counter_ns() at the start of the event.
+            end_ns (int): The time.perf_counter_ns() at the end of the event.
+            rows_in (int, optional): The number of input rows.
+            rows_out (int, optional): The number of output rows.
+            bytes_out (int, optional): The memory size of the output.
+            args (dict, optional): Extra JSON serializable information.
+        """
+        event = {
+            "name": name,
+            "start_ns": start_ns,
+            "duration_ns": end_ns - start_ns,
+            "rows_in": rows_in,
+            "rows_out": rows_out,
+            "bytes_out": bytes_out,
+            "thread": threading.get_ident(),
+            "args": args or {},
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self):
+        """
+        Aggregates the recorded events per name.
+
+        Returns:
+            DataFrame: The 'calls', 'total_s', 'mean_s' and 'max_s' wall time and the
+            summed 'rows_in', 'rows_out' and 'bytes_out' of every event name, sorted by
+            total time.
+        """
+        import pandas as pd
+
+        columns = ["calls", "total_s", "mean_s", "max_s"]
+        columns += ["rows_in", "rows_out", "bytes_out"]
+        if not self.events:
+            return pd.DataFrame(columns=columns, index=pd.Index([], name="name"))
+
+        events = pd.DataFrame(self.events)
+        events["seconds"] = events["duration_ns"] / 1e9
+        grouped = events.groupby("name")
+        summary = pd.DataFrame(
+            {
+                "calls": grouped.size(),
+                "total_s": grouped["seconds"].sum(),
+                "mean_s": grouped["seconds"].mean(),
+                "max_s": grouped["seconds"].max(),
+                "rows_in": grouped["rows_in"].sum(min_count=1),
+                "rows_out": grouped["rows_out"].sum(min_count=1),
+                "bytes_out": grouped["bytes_out"].sum(min_count=1),
+            }
+        )
+        return summary.sort_values("total_s", ascending=False)
+
+    def to_table(self) -> str:
+        """Formats the summary as a plain text table."""
+        return self.summary().to_string()
+
+    def to_chrome_trace(self, path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Exports the recorded events in the Chrome trace event format.
+
+        The trace can be opened in chrome://tracing or https://ui.perfetto.dev, where
+        nested calls, e.g. the queries of check_db_nulls, show up under their caller.
+
+        Args:
+            path (str, optional): A JSON file to write the trace to.
+
+        Returns:
+            dict: The trace.
+        """
+        pid = os.getpid()
+        trace_events = []
+        for event in self.events:
+            args = {
+                key: event[key]
+                for key in ("rows_in", "rows_out", "bytes_out")
+                if event[key] is not None
+            }
+            args.update(event["args"])
+            trace_events.append(
+                {
+                    "name": event["name"],
+                    "ph": "X",
+                    "ts": (event["start_ns"] - self._origin_ns) / 1000,
+                    "dur": event["duration_ns"] / 1000,
+                    "pid": pid,
+                    "tid": event["thread"],
+                    "args": args,
+                }
+            )
+        trace = {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+        if path is not None:
+            with open(path, "w") as file:
+                json.dump(trace, file, default=str)
+        return trace
+
+
+# The registry used by instrument, span and InstrumentedConnection
+registry = MetricsRegistry()
+
+
+def instrument(
+    name: Optional[str] = None, result_attr: Optional[str] = None
+) -> Callable[[Callable], Callable]:
+    """
+    Decorates a function to record its calls in the registry when it is enabled.
+
+    The rows of the first pandas or numpy argument are recorded as 'rows_in', and the
+    rows and memory size of the result as 'rows_out' and 'bytes_out'.
+
+    Args:
+        name (str, optional): The event name, the qualified function name if None.
+        result_attr (str, optional): For methods that store their result instead of
+            returning it, the attribute of self to measure the output of.
+
+    Returns:
+        Callable: The decorator.
+
+    Example:
+        >>> @instrument()
+        ... def get_data(self, data): ...
+    """
+
+    def decorator(func: Callable) -> Callable:
+        event_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return func(*args, **kwargs)
+
+            rows_in = None
+            for arg in (*args, *kwargs.values()):
+                rows_in = _rows(arg)
+                if rows_in is not None:
+                    break
+            start_ns = time.perf_counter_ns()
+            result = func(*args, **kwargs)
+            end_ns = time.perf_counter_ns()
+
+            output = getattr(args[0], result_attr) if result_attr else result
+            registry.record(
+                event_name, start_ns, end_ns, rows_in, _rows(output), _nbytes(output)
+            )
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def span(name: str, **args) -> Iterator[None]:
+    """
+    Records the wall time of a block of code in the registry when it is enabled.
+
+    Args:
+        name (str): The event name.
+        **args: Extra information to record with the event.
+
+    Example:
+        >>> with span("build teams"):
+        ...     teams = {team: Team(team) for team in team_ids}
+    """
+    if not registry.enabled:
+        yield
+        return
+    start_ns = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        registry.record(name, start_ns, time.perf_counter_ns(), args=args)
+
+
+@contextmanager
+def profiling(trace_path: Optional[str] = None) -> Iterator[MetricsRegistry]:
+    """
+    Enables the registry for a block of code, starting from an empty registry.
+
+    Args:
+        trace_path (str, optional): A JSON file to write a Chrome trace to at the end.
+
+    Yields:
+        MetricsRegistry: The registry.
+
+    Example:
+        >>> with profiling("trace.json") as metrics:
+        ...     check_db_nulls(InstrumentedConnection(con), "Match", display_results=False)
+        >>> print(metrics.to_table())
+    """
+    registry.reset()
+    registry.enable()
+    try:
+        yield registry
+    finally:
+        registry.disable()
+        if trace_path is not None:
+            registry.to_chrome_trace(trace_path)
+
+
+class InstrumentedConnection:
+    """
+    A DuckDB connection or relation proxy that records every query it runs in the registry.
+
+    Relations are lazy, so creating a relation and fetching its result are recorded as
+    separate 'duckdb.<method>' events, both with the SQL text. Relations derived from an
+    instrumented relation are instrumented as well. All other attributes are passed
+    through, so the proxy can be used wherever a connection is, e.g. check_db_nulls.
+
+    Attributes:
+        target: The wrapped DuckDBPyConnection or DuckDBPyRelation.
+        query_text (str): The SQL of the wrapped relation, or of the last executed query.
+
+    Example:
+        >>> con = InstrumentedConnection(duckdb.connect())
+        >>> con.query("SELECT 42").fetchall()
+    """
+
+    def __init__(self, target, sql: Optional[str] = None):
+        self.target = target
+        self.query_text = sql
+
+    def _wrap(self, result: Any, sql: Optional[str]) -> Any:
+        if type(result).__name__ in ("DuckDBPyRelation", "DuckDBPyConnection"):
+            if result is self.target:
+                self.query_text = sql
+                return self
+            return InstrumentedConnection(result, sql)
+        return result
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.target, name)
+        if not callable(attr):
+            return attr
+
+        # The registry is checked when the method is called rather than when it is
+        # looked up, so that bound methods and derived relations kept across an
+        # enable or disable are recorded exactly while the registry is enabled
+        @functools.wraps(attr)
+        def method(*args, **kwargs):
+            if name in _QUERY_METHODS and args and isinstance(args[0], str):
+                sql = args[0]
+            else:
+                sql = self.query_text
+            if not registry.enabled:
+                return self._wrap(attr(*args, **kwargs), sql)
+            start_ns = time.perf_counter_ns()
+            result = attr(*args, **kwargs)
+            end_ns = time.perf_counter_ns()
+            if name in _QUERY_METHODS or name in _FETCH_METHODS:
+                registry.record(
+                    f"duckdb.{name}",
+                    start_ns,
+                    end_ns,
+                    rows_out=_rows(result),
+                    bytes_out=_nbytes(result),
+                    args={"sql": sql} if sql else None,
+                )
+            return self._wrap(result, sql)
+
+        return method
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.target.__exit__(*exc_info)
@@ -0,0 +1,429 @@
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from functions.data_format_functions import FeatureScaler
+
+
+class DesignMatrix:
+    """
+    A standardized float32 design matrix with an intercept column, built once and reused.
+
+    The features are standardized with a FeatureScaler, which is fitted on the given
+    features unless one is passed in. A test split should be built with the scaler of
+    the training split, so that it is scaled with the training statistics. The columns
+    of X follow the order of the scaler's columns, whatever the order of the features.
+
+    Attributes:
+        columns (list[str]): The feature names, without the intercept.
+        index (pd.Index): The index of the rows.
+        scaler (FeatureScaler): The scaler the features were standardized with.
+        X (np.ndarray): A float32 array of shape (n_rows, n_features + 1), whose first
+            column is the intercept.
+        y (np.ndarray): The float64 binary target, e.g. 'home_team_win'.
+
+    Methods:
+        rows(positions) -> DesignMatrix: Returns a design matrix of a subset of the rows.
+        predict(coef) -> np.ndarray: Returns the predicted probabilities of a model.
+
+    Raises:
+        ValueError: If the feature columns differ from the columns the scaler was
+            fitted on, or if the features contain missing values.
+
+    Example:
+        >>> train = DesignMatrix(X_train, y_train)
+        >>> test = DesignMatrix(X_test, y_test, scaler=train.scaler)
+    """
+
+    def __init__(
+        self,
+        features: pd.DataFrame,
+        target=None,
+        scaler: Optional[FeatureScaler] = None,
+    ):
+        self.index = features.index
+        self.scaler = scaler if scaler is not None else FeatureScaler().fit(features)
+        # The features are scaled in the order of the scaler's columns, so the
+        # columns are taken from the scaler to keep them aligned with X
+        self.columns = list(features.columns)
+        if self.scaler.columns is not None:
+            missing = [col for col in self.scaler.columns if col not in self.columns]
+            extra = [col for col in self.columns if col not in self.scaler.columns]
+            if missing or extra:
+                raise ValueError(
+                    f"The feature columns differ from the scaler's: missing {missing},"
+                    f" unexpected {extra}."
+                )
+            self.columns = list(self.scaler.columns)
+
+        scaled = self.scaler.transform(features).to_numpy(dtype=np.float32)
+        if np.isnan(scaled).any():
+            raise ValueError("The features contain missing values.")
+        self.X = np.empty((len(features), len(self.columns) + 1), dtype=np.float32)
+        self.X[:, 0] = 1
+        self.X[:, 1:] = scaled
+        self.y = None if target is None else np.asarray(target, dtype=np.float64)
+
+    def rows(self, positions) -> "DesignMatrix":
+        """
+        Returns a design matrix of a subset of the rows, without rescaling them.
+
+        Args:
+            positions (array-like): The row positions or a boolean mask.
+
+        Returns:
+            DesignMatrix: The subset.
+        """
+        subset = DesignMatrix.__new__(DesignMatrix)
+        subset.columns = self.columns
+        subset.index = self.index[positions]
+        subset.scaler = self.scaler
+        subset.X = self.X[positions]
+        subset.y = None if self.y is None else self.y[positions]
+        return subset
+
+    def predict(self, coef) -> np.ndarray:
+        """
+        Returns the predicted probabilities of a logistic model.
+
+        Args:
+            coef (array-like): The intercept followed by the feature coefficients, e.g.
+                a row of l1_logit_path.
+
+        Returns:
+            np.ndarray: The probability of the positive class of every row.
+        """
+        return sigmoid(self.X @ np.asarray(coef, dtype=np.float32))
+
+
+def sigmoid(eta: np.ndarray) -> np.ndarray:
+    """Returns the logistic function of a linear predictor as float64 probabilities."""
+    return 1 / (1 + np.exp(-np.asarray(eta, dtype=np.float64)))
+
+
+def _neg_log_likelihood(X: np.ndarray, y: np.ndarray, coef: np.ndarray) -> float:
+    """Returns the negative log-likelihood of a logistic model, computed stably."""
+    eta = (X @ coef.astype(np.float32)).astype(np.float64)
+    return float(np.sum(np.logaddexp(0, eta) - y * eta))
+
+
+def _gradient_hessian(
+    X: np.ndarray, y: np.ndarray, coef: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the gradient and the Hessian (the weighted Gram matrix) of the log-likelihood."""
+    probs = sigmoid(X @ coef.astype(np.float32))
+    weights = np.maximum(probs * (1 - probs), 1e-10).astype(np.float32)
+    gradient = (X.T @ (y - probs).astype(np.float32)).astype(np.float64)
+    hessian = (X.T @ (X * weights[:, None])).astype(np.float64)
+    return gradient, hessian
+
+
+def _l1_newton_step(
+    gradient: np.ndarray,
+    hessian: np.ndarray,
+    coef: np.ndarray,
+    penalty: np.ndarray,
+    tol: float,
+    max_sweeps: int = 1000,
+) -> np.ndarray:
+    """
+    Minimizes the quadratic approximation of the objective with an L1 penalty by coordinate descent.
+
+    The gradient of the quadratic part is updated with a column of the Hessian after
+    every coordinate change, so no pass over the data is needed. Sweeps run over the
+    nonzero coefficients until they converge, followed by a full sweep to check
+    whether any other coefficient becomes nonzero.
+    """
+    new = coef.copy()
+    # The gradient of the quadratic approximation of -loglike at new
+    quadratic_gradient = -gradient
+    diagonal = np.diag(hessian)
+    all_coefs = np.flatnonzero(diagonal > 0)
+    active = all_coefs
+
+    for _ in range(max_sweeps):
+        max_change = 0.0
+        for j in active:
+            old = new[j]
+            shifted = old - quadratic_gradient[j] / diagonal[j]
+            value = np.sign(shifted) * max(abs(shifted) - penalty[j] / diagonal[j], 0.0)
+            if value != old:
+                quadratic_gradient += hessian[:, j] * (value - old)
+                new[j] = value
+                max_change = max(max_change, abs(value - old))
+        if max_change < tol:
+            if active is all_coefs:
+                break
+            active = all_coefs
+        elif active is all_coefs:
+            active = np.flatnonzero((new != 0) & (diagonal > 0))
+    return new
+
+
+def fit_l1_logit(
+    design: DesignMatrix,
+    alpha: float,
+    start: Optional[np.ndarray] = None,
+    penalize_intercept: bool = True,
+    max_iter: int = 100,
+    tol: float = 1e-6,
+) -> np.ndarray:
+    """
+    Fits an L1 regularized logistic regression by proximal Newton iterations.
+
+    The objective is -loglike(coef) + alpha * sum(|coef|), as in statsmodels'
+    Logit.fit_regularized, where a scalar alpha also penalizes the intercept.
+
+    Args:
+        design (DesignMatrix): The training data.
+        alpha (float): The L1 penalty weight.
+        start (np.ndarray, optional): The starting coefficients, e.g. the solution for a
+            nearby alpha, zeros if None.
+        penalize_intercept (bool, optional): Whether the intercept is penalized.
+        max_iter (int, optional): The maximum number of Newton iterations.
+        tol (float, optional): The convergence tolerance on the coefficients.
+
+    Returns:
+        np.ndarray: The intercept followed by the feature coefficients.
+    """
+    X, y = design.X, design.y
+    penalty = np.full(X.shape[1], float(alpha))
+    if not penalize_intercept:
+        penalty[0] = 0.0
+    coef = (
+        np.zeros(X.shape[1]) if start is None else np.array(start, dtype=np.float64)
+    )
+
+    def objective(coef):
+        return _neg_log_likelihood(X, y, coef) + np.sum(penalty * np.abs(coef))
+
+    current = objective(coef)
+    for _ in range(max_iter):
+        gradient, hessian = _gradient_hessian(X, y, coef)
+        step = _l1_newton_step(gradient, hessian, coef, penalty, tol / 10) - coef
+
+        # Backtracking keeps the objective decreasing where the approximation is poor
+        size = 1.0
+        while True:
+            candidate = coef + size * step
+            value = objective(candidate)
+            if value <= current + 1e-12 * abs(current) or size < 1e-4:
+                break
+            size /= 2
+        coef, current = candidate, value
+        if np.max(np.abs(size * step)) < tol:
+            break
+    return coef
+
+
+def l1_logit_path(
+    design: DesignMatrix,
+    alphas,
+    penalize_intercept: bool = True,
+    max_iter: int = 100,
+    tol: float = 1e-6,
+) -> pd.DataFrame:
+    """
+    Fits L1 regularized logistic regressions over a sequence of penalty weights.
+
+    The alphas are fitted from the largest to the smallest, and every fit starts from
+    the solution of the previous alpha, so that most fits only need a few iterations.
+
+    Args:
+        design (DesignMatrix): The training data.
+        alphas (array-like): The L1 penalty weights.
+        penalize_intercept (bool, optional): Whether the intercept is penalized.
+        max_iter (int, optional): The maximum number of Newton iterations per alpha.
+        tol (float, optional): The convergence tolerance on the coefficients.
+
+    Returns:
+        DataFrame: The coefficients indexed by alpha, in the given order, with a
+        'const' column followed by the feature columns.
+
+    Example:
+        >>> path = l1_logit_path(train, [10, 1, 0.1])
+        >>> predictions = test.predict(path.loc[0.1])
+    """
+    alphas = np.asarray(alphas, dtype=np.float64)
+    coefs = np.empty((len(alphas), design.X.shape[1]))
+    coef = None
+    for position in np.argsort(-alphas, kind="stable"):
+        coef = fit_l1_logit(
+            design, alphas[position], coef, penalize_intercept, max_iter, tol
+        )
+        coefs[position] = coef
+    return pd.DataFrame(
+        coefs,
+        index=pd.Index(alphas, name="alpha"),
+        columns=["const"] + design.columns,
+    )
+
+
+def _fit_ridge_logit(
+    X: np.ndarray,
+    y: np.ndarray,
+    l2: float,
+    start: np.ndarray,
+    hessian: Optional[np.ndarray] = None,
+    max_iter: int = 100,
+    tol: float = 1e-6,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fits a logistic regression with an L2 penalty on the feature coefficients by Newton's method.
+
+    The objective is -loglike(coef) + l2 / 2 * |coef|^2, as in sklearn's
+    LogisticRegression with C = 1 / l2. A Hessian from a previous fit, e.g. on more
+    features, can be given for the first step, saving a pass over the data.
+
+    Returns:
+        tuple: The coefficients and the Hessian of the last iteration.
+    """
+    ridge = np.full(X.shape[1], float(l2))
+    ridge[0] = 0.0
+    coef = start.astype(np.float64)
+    for iteration in range(max_iter):
+        probs = sigmoid(X @ coef.astype(np.float32))
+        gradient = (X.T @ (y - probs).astype(np.float32)).astype(np.float64)
+        gradient -= ridge * coef
+        if iteration > 0 or hessian is None:
+            weights = np.maximum(probs * (1 - probs), 1e-10).astype(np.float32)
+            hessian = (X.T @ (X * weights[:, None])).astype(np.float64)
+        step = np.linalg.solve(hessian + np.diag(ridge), gradient)
+        coef = coef + step
+        if np.max(np.abs(step)) < tol:
+            break
+    return coef, hessian
+
+
+def _elimination_path(
+    X: np.ndarray,
+    y: np.ndarray,
+    step: Union[int, float],
+    min_features: int,
+    l2: float,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Yields the kept features and coefficients of every step of recursive feature elimination.
+
+    The features with the smallest absolute coefficients are removed at every step.
+    Every fit starts from the coefficients and the Hessian of the previous fit,
+    restricted to the kept features, so it typically converges in a few iterations.
+    """
+    n_features = X.shape[1] - 1
+    n_step = max(int(step * n_features), 1) if step < 1 else int(step)
+    kept = np.arange(n_features)
+    coef = np.zeros(n_features + 1)
+    hessian = None
+
+    while True:
+        columns = np.r_[0, kept + 1]
+        coef, hessian = _fit_ridge_logit(X[:, columns], y, l2, coef, hessian)
+        yield kept, coef
+        if len(kept) <= min_features:
+            return
+
+        n_removed = min(n_step, len(kept) - min_features)
+        removed = np.argsort(np.abs(coef[1:]), kind="stable")[:n_removed]
+        keep = np.setdiff1d(np.arange(len(kept)), removed)
+        kept = kept[keep]
+        keep_columns = np.r_[0, keep + 1]
+        coef = coef[keep_columns]
+        hessian = hessian[np.ix_(keep_columns, keep_columns)]
+
+
+def recursive_feature_elimination(
+    design: DesignMatrix,
+    n_features_to_select: Optional[int] = None,
+    step: Union[int, float] = 1,
+    l2: float = 1.0,
+) -> pd.Series:
+    """
+    Ranks features by recursive feature elimination with a logistic regression.
+
+    This is the equivalent of sklearn's RFE(LogisticRegression(C=1 / l2)), where several
+    features can be removed per step and every fit is warm started from the previous.
+
+    Args:
+        design (DesignMatrix): The training data.
+        n_features_to_select (int, optional): The number of features to keep, half of
+            the features if None.
+        step (int or float, optional): The number of features to remove per step, or a
+            fraction of the features if below 1.
+        l2 (float, optional): The L2 penalty weight of the logistic regression.
+
+    Returns:
+        pd.Series: The rank of every feature, 1 for the selected features and higher
+        for features removed earlier, like RFE.ranking_.
+    """
+    n_features = len(design.columns)
+    if n_features_to_select is None:
+        n_features_to_select = n_features // 2
+
+    ranking = np.zeros(n_features, dtype=np.int64)
+    for kept, _ in _elimination_path(
+        design.X, design.y, step, n_features_to_select, l2
+    ):
+        ranking[kept] += 1
+    ranking = ranking.max() - ranking + 1
+    return pd.Series(ranking, index=design.columns, name="ranking")
+
+
+def _stratified_folds(y: np.ndarray, cv: int) -> np.ndarray:
+    """Assigns every row to one of cv folds, spreading each class evenly over the folds."""
+    folds = np.empty(len(y), dtype=np.int64)
+    for label in np.unique(y):
+        rows = np.flatnonzero(y == label)
+        folds[rows] = np.arange(len(rows)) % cv
+    return folds
+
+
+def recursive_feature_elimination_cv(
+    design: DesignMatrix,
+    step: Union[int, float] = 1,
+    cv: int = 10,
+    min_features_to_select: int = 1,
+    l2: float = 1.0,
+) -> Tuple[List[str], pd.DataFrame]:
+    """
+    Selects the number of features by cross-validated recursive feature elimination.
+
+    This is the equivalent of sklearn's RFECV(LogisticRegression(C=1 / l2), cv=cv),
+    scored by accuracy on stratified folds. The design matrix is built once and
+    every fold works on row subsets of it.
+
+    Args:
+        design (DesignMatrix): The training data.
+        step (int or float, optional): The number of features to remove per step, or a
+            fraction of the features if below 1.
+        cv (int, optional): The number of folds.
+        min_features_to_select (int, optional): The smallest number of features to try.
+        l2 (float, optional): The L2 penalty weight of the logistic regression.
+
+    Returns:
+        tuple: The selected feature names, and the 'mean_accuracy' and 'std_accuracy'
+        of every number of features.
+    """
+    folds = _stratified_folds(design.y, cv)
+    scores = {}
+    for fold in range(cv):
+        train, test = folds != fold, folds == fold
+        X_test, y_test = design.X[test], design.y[test]
+        for kept, coef in _elimination_path(
+            design.X[train], design.y[train], step, min_features_to_select, l2
+        ):
+            probs = sigmoid(X_test[:, np.r_[0, kept + 1]] @ coef.astype(np.float32))
+            accuracy = np.mean((probs >= 0.5) == (y_test == 1))
+            scores.setdefault(len(kept), []).append(accuracy)
+
+    results = pd.DataFrame(
+        {
+            "mean_accuracy": {n: np.mean(values) for n, values in scores.items()},
+            "std_accuracy": {n: np.std(values) for n, values in scores.items()},
+        }
+    ).sort_index()
+    results.index.name = "n_features"
+    n_best = int(results["mean_accuracy"].idxmax())
+
+    ranking = recursive_feature_elimination(design, n_best, step, l2)
+    return ranking.index[ranking == 1].to_list(), results
@@ -0,0 +1,160 @@
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from functions.data_access_functions import MATCH_LINEUP_COLUMNS
+from functions.project_functions_classes import AttributeIndex, build_match_features
+
+# The indexes a worker process rebuilds from the memory-mapped arrays
+_worker_indexes: Dict[str, AttributeIndex] = {}
+
+
+def _save_index(index: AttributeIndex, cols: List[str], directory: str) -> str:
+    """
+    Saves the arrays of an index to a directory, so that workers can memory-map them.
+
+    Args:
+        index (AttributeIndex): The index to save.
+        cols (list[str]): The attribute columns to save.
+        directory (str): The directory to save the arrays to.
+
+    Returns:
+        str: The directory.
+    """
+    os.makedirs(directory)
+    arrays = index.to_arrays(cols)
+    for name, array in arrays.items():
+        if array.dtype == object:
+            with open(os.path.join(directory, name + ".pkl"), "wb") as file:
+                pickle.dump(array, file)
+        else:
+            np.save(os.path.join(directory, name + ".npy"), array)
+    with open(os.path.join(directory, "meta.pkl"), "wb") as file:
+        pickle.dump({"cols": cols, "id_name": index.id_name}, file)
+    return directory
+
+
+def _load_index(directory: str) -> AttributeIndex:
+    """
+    Rebuilds an index saved with _save_index on read-only memory-mapped arrays.
+
+    Args:
+        directory (str): The directory the arrays were saved to.
+
+    Returns:
+        AttributeIndex: The rebuilt index.
+    """
+    arrays = {}
+    for file_name in os.listdir(directory):
+        name, extension = os.path.splitext(file_name)
+        path = os.path.join(directory, file_name)
+        if extension == ".npy":
+            arrays[name] = np.load(path, mmap_mode="r")
+        elif name != "meta":
+            with open(path, "rb") as file:
+                arrays[name] = pickle.load(file)
+    with open(os.path.join(directory, "meta.pkl"), "rb") as file:
+        meta = pickle.load(file)
+    return AttributeIndex.from_arrays(arrays, meta["cols"], meta["id_name"])
+
+
+def _init_worker(team_directory: str, player_directory: str) -> None:
+    """Rebuilds the team and player indexes once per worker process."""
+    _worker_indexes["team"] = _load_index(team_directory)
+    _worker_indexes["player"] = _load_index(player_directory)
+
+
+def _build_shard(
+    matches: pd.DataFrame,
+    team_cols: List[str],
+    player_cols: List[str],
+    how: str,
+    date_col: str,
+) -> pd.DataFrame:
+    """Builds the features of one shard of matches in a worker process."""
+    return build_match_features(
+        matches,
+        _worker_indexes["team"],
+        _worker_indexes["player"],
+        team_cols,
+        player_cols,
+        how,
+        date_col,
+    )
+
+
+def build_match_features_parallel(
+    matches: pd.DataFrame,
+    team_index: AttributeIndex,
+    player_index: AttributeIndex,
+    team_cols: List[str],
+    player_cols: List[str],
+    how: str = "avg_diff",
+    shard_col: str = "season",
+    max_workers: Optional[int] = None,
+    date_col: str = "date",
+) -> pd.DataFrame:
+    """
+    Builds the team and player features of every match in a pool of worker processes.
+
+    The matches are sharded by season (or any other column, e.g. league), and every
+    worker builds its shards with build_match_features on read-only memory-mapped
+    copies of the attribute indexes, which are shared through the page cache rather
+    than copied per worker. Every match is computed independently, so the result is
+    identical to a serial build_match_features call.
+
+    Args:
+        matches (DataFrame): The matches with team id, lineup and shard_col columns,
+            indexed by match id.
+        team_index (AttributeIndex): An index of the team attribute entries.
+        player_index (AttributeIndex): An index of the player attribute entries.
+        team_cols (list[str]): The team attributes to use.
+        player_cols (list[str]): The player attributes to use.
+        how (str, optional): The player attribute export mode.
+        shard_col (str, optional): The column to shard matches by.
+        max_workers (int, optional): The number of worker processes, the number of
+            CPUs if None.
+        date_col (str, optional): The column of matches containing the match dates.
+
+    Returns:
+        DataFrame: The features indexed by match id, in the order of matches.
+    """
+    needed_cols = [date_col, "home_team_api_id", "away_team_api_id"]
+    needed_cols += MATCH_LINEUP_COLUMNS
+    shards = [
+        shard[needed_cols]
+        for _, shard in matches.groupby(shard_col, sort=True, dropna=False)
+    ]
+
+    # /dev/shm keeps the memory-mapped arrays in memory where it is available
+    temp_root = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    with tempfile.TemporaryDirectory(dir=temp_root) as directory:
+        team_directory = _save_index(
+            team_index, team_cols, os.path.join(directory, "team")
+        )
+        player_directory = _save_index(
+            player_index, player_cols, os.path.join(directory, "player")
+        )
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(team_directory, player_directory),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _build_shard, shard, team_cols, player_cols, how, date_col
+                )
+                for shard in shards
+            ]
+            features = [future.result() for future in futures]
+
+    if not features:
+        return build_match_features(
+            matches, team_index, player_index, team_cols, player_cols, how, date_col
+        )
+    return pd.concat(features).loc[matches.index]
@@ -1,7 +1,282 @@
 import pandas as pd
 from datetime import datetime
 import numpy as np
-from typing import Tuple, Dict, Any, List
+from typing import Tuple, Dict, Any, List, Iterable, Iterator
+
+from functions.data_format_functions import MISSING_DAY, day_numbers
+from functions.instrumentation_functions import instrument
+
+_NS_PER_DAY = 86_400_000_000_000
+
+
+def _date_values(dates) -> np.ndarray:
+    """
+    Converts dates to int64 nanosecond values, with NaT mapped to the int64 minimum.
+
+    Args:
+        dates: A scalar or array-like of dates or "YYYY-MM-DD" strings, or of integer
+            day numbers as in tables converted with compact_attributes.
+
+    Returns:
+        np.ndarray: The dates as an int64 array.
+    """
+    values = np.atleast_1d(np.asarray(dates))
+    if np.issubdtype(values.dtype, np.integer):
+        days = values.astype(np.int64)
+        return np.where(days == MISSING_DAY, np.iinfo(np.int64).min, days * _NS_PER_DAY)
+    dates = pd.to_datetime(values)
+    return np.asarray(dates.values.astype("datetime64[ns]")).view("int64")
+
+
+def _comparable_date(entry_dates: pd.Series, date):
+    """
+    Returns a date in the representation of the entry dates it is compared with.
+
+    Args:
+        entry_dates (Series): The 'date' column of attribute entries.
+        date: The date to compare against.
+
+    Returns:
+        The date as a day number if the entry dates are day numbers, else unchanged.
+    """
+    if pd.api.types.is_integer_dtype(entry_dates):
+        return int(day_numbers(date)[0])
+    return date
+
+
+def _latest_entry(entries: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the latest of the given attribute entries as a single row frame.
+
+    An id can have several entries on the same date, of which the one with the
+    highest 'id' is taken, or the last one in input order without an 'id' column.
+    This is the same entry that AttributeIndex.positions finds.
+
+    Args:
+        entries (DataFrame): The attribute entries of one id with a 'date' column.
+
+    Returns:
+        DataFrame: The latest entry, empty if there are no entries.
+    """
+    keys = ["date", "id"] if "id" in entries.columns else ["date"]
+    return entries.sort_values(keys, kind="mergesort").iloc[-1:]
+
+
+class AttributeIndex:
+    """
+    A date sorted index of attribute entries for batched point-in-time lookups.
+
+    The entries are sorted once by id and date, after which the latest entry before
+    any number of (id, date) pairs is found with a single binary search, instead of
+    filtering the full attribute frame for every pair. When an id has several entries
+    on its latest date, the one with the highest 'id' is taken, or the last one in
+    input order if the entries have no 'id' column.
+
+    Attributes:
+        id_name (str): The name of the id column.
+        data (DataFrame): The attribute entries sorted by id and date.
+        ids (np.ndarray): The unique ids in sorted order.
+        offsets (np.ndarray): The start of every id's entries in data, followed by
+            the total number of entries.
+        dates (np.ndarray): The entry dates as int64 nanosecond values.
+
+    Methods:
+        positions(ids, dates) -> np.ndarray:
+            Returns the row positions of the latest entries before the given dates.
+        lookup(ids, dates, cols, index=None) -> DataFrame:
+            Returns the latest entries before the given dates.
+        lookup_array(ids, dates, cols) -> np.ndarray:
+            Returns the latest attribute values before the given dates as a dense array.
+        latest_entries(matches, id_col, cols, date_col='date') -> DataFrame:
+            Returns the latest entries before the match dates for every match.
+    """
+
+    def __init__(
+        self, data: pd.DataFrame, id_name: str = "team_api_id", date_name="date"
+    ):
+        self.id_name = id_name
+        # Entries without a date are never before any date
+        self.data = data.assign(_date=_date_values(data[date_name]))
+        self.data = self.data.loc[self.data["_date"] != np.iinfo(np.int64).min]
+        # Entries on the same date are ordered by their row id, so that the last
+        # entry before a date is the one with the highest id
+        keys = [id_name, "_date"] + (["id"] if "id" in self.data.columns else [])
+        self.data = self.data.sort_values(keys, kind="mergesort").reset_index(
+            drop=True
+        )
+        self.dates = self.data.pop("_date").to_numpy()
+
+        ids = self.data[id_name].to_numpy()
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) else []
+        self.ids = ids[starts]
+        self.offsets = np.append(starts, len(ids)).astype(np.int64)
+
+        # Dates are replaced by their rank so that (id, date) pairs can be
+        # searched as a single sorted integer key
+        self._unique_dates = np.unique(self.dates)
+        self._key_base = len(self._unique_dates) + 1
+        groups = np.repeat(np.arange(len(self.ids)), np.diff(self.offsets))
+        self._keys = groups * self._key_base + np.searchsorted(
+            self._unique_dates, self.dates
+        )
+        self._id_lookup = pd.Index(self.ids)
+        self._values: Dict[Tuple[str, ...], np.ndarray] = {}
+
+    def positions(self, ids, dates) -> np.ndarray:
+        """
+        Returns the row positions in data of the latest entries strictly before the given dates.
+
+        Args:
+            ids (array-like): The ids to look up.
+            dates (array-like): The dates to compare against, one per id.
+
+        Returns:
+            np.ndarray: The row positions, -1 where there is no entry before the date.
+        """
+        groups = self._id_lookup.get_indexer(np.asarray(ids, dtype=object).ravel())
+        dates = _date_values(dates).ravel()
+        ranks = np.searchsorted(self._unique_dates, dates, side="left")
+        keys = np.where(groups >= 0, groups, 0) * self._key_base + ranks
+        positions = np.searchsorted(self._keys, keys, side="left") - 1
+
+        valid = (
+            (groups >= 0)
+            & (dates != np.iinfo(np.int64).min)
+            & (positions >= self.offsets[np.where(groups >= 0, groups, 0)])
+        )
+        return np.where(valid, positions, -1)
+
+    def lookup(self, ids, dates, cols: List[str], index=None) -> pd.DataFrame:
+        """
+        Returns the latest entries strictly before the given dates.
+
+        Args:
+            ids (array-like): The ids to look up.
+            dates (array-like): The dates to compare against, one per id.
+            cols (list[str]): The attribute columns to return.
+            index (array-like, optional): The index of the returned DataFrame.
+
+        Returns:
+            DataFrame: One row per id, NaN where there is no entry before the date.
+        """
+        latest = self.data[cols].reindex(self.positions(ids, dates))
+        latest.index = pd.RangeIndex(len(latest)) if index is None else index
+        return latest
+
+    def values(self, cols: List[str]) -> np.ndarray:
+        """
+        Returns the attribute columns as a float array with a trailing row of NaN values.
+
+        The array is cached per column selection, and the trailing row is what a
+        position of -1 points to, so missing entries need no separate handling.
+
+        Args:
+            cols (list[str]): The attribute columns to return.
+
+        Returns:
+            np.ndarray: An array of shape (len(data) + 1, len(cols)).
+        """
+        key = tuple(cols)
+        if key not in self._values:
+            values = self.data[cols].apply(pd.to_numeric, errors="coerce")
+            self._values[key] = np.vstack(
+                [values.to_numpy(dtype=np.float64), np.full((1, len(cols)), np.nan)]
+            )
+        return self._values[key]
+
+    def lookup_array(self, ids, dates, cols: List[str]) -> np.ndarray:
+        """
+        Returns the latest attribute values strictly before the given dates as a dense array.
+
+        Args:
+            ids (array-like): The ids to look up, of shape (n,) or (n, m), e.g. the 22
+                player ids of n matches.
+            dates (array-like): The dates to compare against, of shape (n,).
+            cols (list[str]): The attribute columns to return.
+
+        Returns:
+            np.ndarray: An array of shape ids.shape + (len(cols),), NaN where there is
+            no entry before the date.
+        """
+        ids = np.asarray(ids, dtype=object)
+        dates = np.asarray(dates)
+        if ids.ndim == 2:
+            dates = np.repeat(dates, ids.shape[1])
+        positions = self.positions(ids.ravel(), dates)
+        return self.values(cols)[positions].reshape(ids.shape + (len(cols),))
+
+    def latest_entries(
+        self, matches: pd.DataFrame, id_col: str, cols: List[str], date_col="date"
+    ) -> pd.DataFrame:
+        """
+        Returns the latest attribute entries before the match date for every match.
+
+        This is the batched equivalent of calling Team.get_latest_entry for every match
+        and concatenating the results, with the same tie-break between entries on the
+        same date.
+
+        Args:
+            matches (DataFrame): The matches to look up.
+            id_col (str): The column of matches containing the ids, e.g. 'home_team_api_id'.
+            cols (list[str]): The attribute columns to return.
+            date_col (str, optional): The column of matches containing the match dates.
+
+        Returns:
+            DataFrame: The latest attribute entries indexed by the matches index.
+        """
+        return self.lookup(matches[id_col], matches[date_col], cols, matches.index)
+
+    def to_arrays(self, cols: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Returns the arrays needed to look up the given attribute columns.
+
+        Together with from_arrays this lets an index be rebuilt elsewhere, e.g. in
+        another process from memory-mapped copies of the arrays.
+
+        Args:
+            cols (list[str]): The attribute columns to keep.
+
+        Returns:
+            dict: The sorted ids, offsets, dates, search keys, unique dates and values.
+        """
+        return {
+            "ids": self.ids,
+            "offsets": self.offsets,
+            "dates": self.dates,
+            "keys": self._keys,
+            "unique_dates": self._unique_dates,
+            "values": self.values(cols),
+        }
+
+    @classmethod
+    def from_arrays(
+        cls, arrays: Dict[str, np.ndarray], cols: List[str], id_name: str
+    ) -> "AttributeIndex":
+        """
+        Rebuilds an index from the arrays returned by to_arrays, without copying them.
+
+        The data of the rebuilt index only holds the given attribute columns.
+
+        Args:
+            arrays (dict): The arrays returned by to_arrays.
+            cols (list[str]): The attribute columns the arrays were created with.
+            id_name (str): The name of the id column.
+
+        Returns:
+            AttributeIndex: The rebuilt index.
+        """
+        index = cls.__new__(cls)
+        index.id_name = id_name
+        index.ids = arrays["ids"]
+        index.offsets = arrays["offsets"]
+        index.dates = arrays["dates"]
+        index.data = pd.DataFrame(arrays["values"][:-1], columns=cols, copy=False)
+        index._unique_dates = arrays["unique_dates"]
+        index._key_base = len(index._unique_dates) + 1
+        index._keys = arrays["keys"]
+        index._id_lookup = pd.Index(index.ids)
+        index._values = {tuple(cols): arrays["values"]}
+        return index
 
 
 class Team:
@@ -15,12 +290,19 @@ class Team:
     Methods:
         get_data(data: DataFrame, id_name: str = 'team_api_id') -> None:
             Retrieves and stores the attribute entries for the team from the given DataFrame.
+        from_index(index: AttributeIndex) -> dict[int, Team]:
+            Creates every team of an attribute index, sharing the index's sorted entries.
+        from_data(data: DataFrame, id_name: str = 'team_api_id') -> dict[int, Team]:
+            Creates every team in the given DataFrame with a single sort.
     """
 
     def __init__(self, id_code):
         self.id_code = id_code
         self.attribute_entries: pd.DataFrame = None
+        # The sorted int64 entry dates, set when the entries are a slice of an index
+        self._entry_dates: np.ndarray = None
 
+    @instrument(result_attr="attribute_entries")
     def get_data(self, data: pd.DataFrame, id_name="team_api_id"):
         """
         Retrieves and stores the attribute entries for the team from the given DataFrame.
@@ -34,13 +316,65 @@ class Team:
             None
         """
         self.attribute_entries = data.loc[data[id_name] == self.id_code]
+        self._entry_dates = None
+
+    @classmethod
+    def from_index(cls, index: AttributeIndex) -> Dict[Any, "Team"]:
+        """
+        Creates every team of an attribute index, sharing the index's sorted entries.
+
+        The attribute entries of every team are a slice of the index data, so no entries
+        are copied, and get_latest_entry finds the latest entry with a binary search
+        on the slice dates. Entries without a date are left out, as they are never
+        before any date.
+
+        Args:
+            index (AttributeIndex): An index of the team attribute entries.
+
+        Returns:
+            dict: The teams keyed by their ID code.
+        """
+        teams = {}
+        for number, id_code in enumerate(index.ids):
+            start, stop = index.offsets[number], index.offsets[number + 1]
+            team = cls(id_code)
+            team.attribute_entries = index.data.iloc[start:stop]
+            team._entry_dates = index.dates[start:stop]
+            teams[id_code] = team
+        return teams
+
+    @classmethod
+    @instrument("Team.from_data")
+    def from_data(cls, data: pd.DataFrame, id_name="team_api_id") -> Dict[Any, "Team"]:
+        """
+        Creates every team in the given DataFrame with a single sort of the entries.
 
+        This replaces creating a Team per ID and calling get_data on each, which scans
+        the full DataFrame once per team.
+
+        Args:
+            data (DataFrame): The DataFrame containing the attribute entries.
+            id_name (str, optional): The name of the ID column (default: 'team_api_id').
+
+        Returns:
+            dict: The teams keyed by their ID code.
+
+        Example:
+            >>> teams = Team.from_data(team_attr_raw)
+            >>> teams[9825].get_latest_entry("2015-01-01", ["buildUpPlaySpeed"])
+        """
+        return cls.from_index(AttributeIndex(data, id_name))
+
+    @instrument()
     def get_latest_entry(
         self, date: str, cols: list[str], merge_id: str = "team_api_id"
     ) -> pd.DataFrame:
         """
         Returns the latest attribute entry before the specified date.
 
+        Of several entries on the latest date, only the one with the highest 'id' is
+        returned, as in AttributeIndex.
+
         Args:
             date (str): The date to compare against in "YYYY-MM-DD" format.
 
@@ -48,12 +382,20 @@ class Team:
             DataFrame: The latest attribute entry before the specified date.
 
         """
-        entries_before_date = self.attribute_entries[
-            self.attribute_entries["date"] < date
-        ]
-        latest_entry = entries_before_date[
-            entries_before_date["date"] == entries_before_date["date"].max()
-        ][[merge_id] + cols].set_index(merge_id)
+        if self._entry_dates is not None:
+            # The slice is sorted by date and id, so the latest entry is the last one
+            stop = np.searchsorted(self._entry_dates, _date_values(date)[0], "left")
+            latest_entry = self.attribute_entries.iloc[max(stop - 1, 0) : stop][
+                [merge_id] + cols
+            ].set_index(merge_id)
+        else:
+            entry_dates = self.attribute_entries["date"]
+            entries_before_date = self.attribute_entries[
+                entry_dates < _comparable_date(entry_dates, date)
+            ]
+            latest_entry = _latest_entry(entries_before_date)[
+                [merge_id] + cols
+            ].set_index(merge_id)
 
         if len(latest_entry) == 0:
             latest_entry = latest_entry.reindex([self.id_code])
@@ -92,7 +434,8 @@ class MatchPlayers:
         Methods:
             __init__(player_id: str): Initializes the Player class with the player's ID.
             get_player_attributes(player_data: pd.DataFrame, date, player_id_name: str = "player_api_id"):
-                Retrieves the player's attributes from player_data DataFrame based on the provided date.
+                Retrieves the player's attributes from player_data DataFrame based on the provided date,
+                taking the entry with the highest 'id' of several on the latest date.
     """
 
     def __init__(self):
@@ -107,23 +450,22 @@ class MatchPlayers:
             self.player_id: str = player_id
             self.attributes: dict
 
+        @instrument()
         def get_player_attributes(
             self, player_data: pd.DataFrame, date, player_id_name: str = "player_api_id"
         ):
             entries = player_data.loc[player_data[player_id_name] == self.player_id]
-            entries_before_date = entries.loc[entries["date"] < date]
-            latest_entry = (
-                entries_before_date[
-                    entries_before_date["date"] == entries_before_date["date"].max()
-                ]
-                .squeeze()
-                .to_dict()
-            )
+            entries_before_date = entries.loc[
+                entries["date"] < _comparable_date(entries["date"], date)
+            ]
+            latest_entry = _latest_entry(entries_before_date).squeeze().to_dict()
             self.attributes = latest_entry
 
+    @instrument()
     def get_data(self, data: pd.DataFrame):
         self.match_data = data.to_dict()
 
+    @instrument()
     def get_player_positions(self):
         self.home_player_pos = {}
         self.away_player_pos = {}
@@ -137,6 +479,7 @@ class MatchPlayers:
                 self.match_data["away_player_Y" + str(i)],
             )
 
+    @instrument()
     def get_player_ids(self):
         # initiate empty dictionaries
         self.home_players = {}
@@ -168,6 +511,7 @@ class MatchPlayers:
         ]
         self.away_players["goaly"] = self.Player(self.match_data[goaly_away_num])
 
+    @instrument()
     def calculate_attribute_difference(self, attribute):
         try:
             home_avg = sum(
@@ -181,6 +525,7 @@ class MatchPlayers:
         except Exception:
             return np.nan
 
+    @instrument()
     def export_player_attributes(self, cols, how: str = "all"):
         atts = {}
 
@@ -259,6 +604,435 @@ class MatchPlayers:
         return atts
 
 
+def resolve_player_attributes(
+    match_players: pd.Series, dates: pd.Series, player_index: AttributeIndex
+) -> None:
+    """
+    Sets the attributes of every player in the given matches with a single batched lookup.
+
+    This is the batched equivalent of calling Player.get_player_attributes for the 22
+    players of every match. Players without an entry before the match date get
+    attributes with NaN values.
+
+    Args:
+        match_players (pd.Series): MatchPlayers objects on which get_player_ids was called.
+        dates (pd.Series): The match dates, aligned with match_players.
+        player_index (AttributeIndex): An index of the player attribute entries.
+
+    Returns:
+        None
+    """
+    players = [
+        player
+        for match in match_players
+        for side in (match.home_players, match.away_players)
+        for player in side["players"] + [side["goaly"]]
+    ]
+    counts = [
+        len(side["players"]) + 1
+        for match in match_players
+        for side in (match.home_players, match.away_players)
+    ]
+    side_dates = np.repeat(np.asarray(dates), 2)
+    positions = player_index.positions(
+        [player.player_id for player in players], np.repeat(side_dates, counts)
+    )
+
+    # Only the distinct entries that were found are converted to dicts, the players
+    # sharing an entry share its dict
+    found, inverse = np.unique(positions, return_inverse=True)
+    missing = dict.fromkeys(player_index.data.columns, np.nan)
+    records = player_index.data.iloc[found[found >= 0]].to_dict("records")
+    if len(found) and found[0] < 0:
+        records.insert(0, missing)
+    for player, number in zip(players, inverse.ravel()):
+        player.attributes = records[number]
+
+
+def lineup_arrays(matches: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the player ids and (X, Y) coordinates from the lineup columns of the Match table.
+
+    Args:
+        matches (DataFrame): The matches with 'home_player_1' to 'away_player_Y11' columns.
+
+    Returns:
+        tuple: An object array of player ids of shape (n_matches, 2, 11) and a float32
+        array of coordinates of shape (n_matches, 2, 11, 2).
+    """
+    slots = np.arange(1, 12)
+    sides = ("home", "away")
+    id_cols = [f"{side}_player_{i}" for side in sides for i in slots]
+    pos_cols = [
+        f"{side}_player_{axis}{i}" for side in sides for i in slots for axis in "XY"
+    ]
+    n_matches = len(matches)
+
+    player_ids = matches[id_cols].to_numpy(dtype=object).reshape(n_matches, 2, 11)
+    positions = (
+        matches[pos_cols]
+        .apply(pd.to_numeric, errors="coerce")
+        .to_numpy(dtype=np.float32)
+        .reshape(n_matches, 2, 11, 2)
+    )
+    return player_ids, positions
+
+
+def _lineup_order(positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Finds the goalkeepers of lineups and the slot order that puts them last.
+
+    The goalkeeper is the first player at the (1, 1) coordinate, as in
+    MatchPlayers.get_player_ids.
+
+    Args:
+        positions (np.ndarray): Coordinates of shape (..., 11, 2).
+
+    Returns:
+        tuple: The goalkeeper slot indices (-1 where there is none), the slot order with
+        the outfield players in lineup order followed by the goalkeeper, and the number
+        of players at (1, 1) in every lineup.
+    """
+    is_goalkeeper = (positions[..., 0] == 1) & (positions[..., 1] == 1)
+    goalkeeper_count = is_goalkeeper.sum(axis=-1)
+    goalkeeper_slots = np.where(goalkeeper_count > 0, is_goalkeeper.argmax(axis=-1), -1)
+    slot_keys = np.where(np.arange(11) == goalkeeper_slots[..., None], 11, np.arange(11))
+    order = np.argsort(slot_keys, axis=-1, kind="stable")
+    return goalkeeper_slots, order, goalkeeper_count
+
+
+def parse_lineups(
+    matches: pd.DataFrame,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Finds the goalkeepers and outfield players of every match in a single pass.
+
+    This is the batched equivalent of calling MatchPlayers.get_player_positions and
+    MatchPlayers.get_player_ids for every match.
+
+    Args:
+        matches (DataFrame): The matches with 'home_player_1' to 'away_player_Y11' columns.
+
+    Returns:
+        tuple: Four arrays, where the second axis is the side (0 for home, 1 for away):
+            - goalkeeper_slots (np.ndarray): The 0-based goalkeeper slot of shape
+              (n_matches, 2), -1 where there is no goalkeeper.
+            - goalkeeper_ids (np.ndarray): The goalkeeper ids of shape (n_matches, 2).
+            - outfield_ids (np.ndarray): The outfield player ids in lineup order of shape
+              (n_matches, 2, 10).
+            - flagged (np.ndarray): A boolean array of shape (n_matches,) marking matches
+              where a side has no goalkeeper or more than one player at (1, 1).
+    """
+    player_ids, positions = lineup_arrays(matches)
+    goalkeeper_slots, order, goalkeeper_count = _lineup_order(positions)
+    player_ids = np.take_along_axis(player_ids, order, axis=-1)
+
+    goalkeeper_ids = np.where(goalkeeper_slots >= 0, player_ids[..., 10], None)
+    flagged = (goalkeeper_count != 1).any(axis=-1)
+    return goalkeeper_slots, goalkeeper_ids, player_ids[..., :10], flagged
+
+
+class MatchLineupTensor:
+    """
+    An array backed representation of the starting lineups and player attributes of many matches.
+
+    Side 0 is the home team and side 1 the away team. Slots 0 to 9 hold the outfield
+    players in lineup order and slot 10 holds the goalkeeper, which is the same order
+    MatchPlayers uses. Matches without a goalkeeper keep their lineup order, have no
+    goalkeeper slot flagged and NaN attributes.
+
+    Attributes:
+        index (pd.Index): The match ids.
+        cols (list[str]): The names of the player attributes.
+        attributes (np.ndarray): A float32 array of shape (n_matches, 2, 11, len(cols)).
+        player_ids (np.ndarray): An int64 array of shape (n_matches, 2, 11), -1 where missing.
+        positions (np.ndarray): A float32 array of shape (n_matches, 2, 11, 2) with the
+            (X, Y) coordinate of every slot.
+        goalkeeper (np.ndarray): A boolean array of shape (n_matches, 2, 11) flagging
+            the goalkeeper slots.
+
+    Methods:
+        from_matches(matches, player_index, cols, date_col='date') -> MatchLineupTensor:
+            Builds the tensor from the lineup columns of the Match table.
+        from_arrays(index, raw_ids, positions, dates, player_index, cols) -> MatchLineupTensor:
+            Builds the tensor from lineup arrays.
+        export_player_attributes(how: str = "all") -> DataFrame:
+            Exports the player attributes of every match with the same columns as
+            MatchPlayers.export_player_attributes.
+    """
+
+    def __init__(
+        self,
+        index: pd.Index,
+        cols: List[str],
+        attributes: np.ndarray,
+        player_ids: np.ndarray,
+        positions: np.ndarray,
+        goalkeeper: np.ndarray,
+    ):
+        self.index = index
+        self.cols = list(cols)
+        self.attributes = attributes
+        self.player_ids = player_ids
+        self.positions = positions
+        self.goalkeeper = goalkeeper
+
+    @classmethod
+    def from_matches(
+        cls,
+        matches: pd.DataFrame,
+        player_index: AttributeIndex,
+        cols: List[str],
+        date_col: str = "date",
+    ) -> "MatchLineupTensor":
+        """
+        Builds the tensor from the lineup columns of the Match table.
+
+        Args:
+            matches (DataFrame): The matches with 'home_player_1' to 'away_player_Y11' columns.
+            player_index (AttributeIndex): An index of the player attribute entries.
+            cols (list[str]): The player attributes to store.
+            date_col (str, optional): The column of matches containing the match dates.
+
+        Returns:
+            MatchLineupTensor: The lineups and player attributes of the matches.
+        """
+        raw_ids, positions = lineup_arrays(matches)
+        return cls.from_arrays(
+            matches.index, raw_ids, positions, matches[date_col], player_index, cols
+        )
+
+    @classmethod
+    def from_arrays(
+        cls,
+        index: pd.Index,
+        raw_ids: np.ndarray,
+        positions: np.ndarray,
+        dates,
+        player_index: AttributeIndex,
+        cols: List[str],
+    ) -> "MatchLineupTensor":
+        """
+        Builds the tensor from lineup arrays in the order of the Match table columns.
+
+        Args:
+            index (pd.Index): The match ids.
+            raw_ids (np.ndarray): The player ids of shape (n_matches, 2, 11).
+            positions (np.ndarray): The (X, Y) coordinates of shape (n_matches, 2, 11, 2).
+            dates (array-like): The match dates of shape (n_matches,).
+            player_index (AttributeIndex): An index of the player attribute entries.
+            cols (list[str]): The player attributes to store.
+
+        Returns:
+            MatchLineupTensor: The lineups and player attributes of the matches.
+        """
+        n_matches = len(index)
+        positions = np.asarray(positions, dtype=np.float32)
+        goalkeeper_slots, order, _ = _lineup_order(positions)
+        has_goalkeeper = goalkeeper_slots >= 0
+
+        raw_ids = np.take_along_axis(raw_ids, order, axis=-1)
+        positions = np.take_along_axis(positions, order[..., None], axis=-2)
+        goalkeeper = np.zeros((n_matches, 2, 11), dtype=bool)
+        goalkeeper[..., 10] = has_goalkeeper
+
+        attributes = player_index.lookup_array(
+            raw_ids.reshape(n_matches, 22), dates, cols
+        ).reshape(n_matches, 2, 11, len(cols))
+        attributes[~has_goalkeeper.all(axis=-1)] = np.nan
+
+        player_ids = (
+            pd.to_numeric(pd.Series(raw_ids.ravel()), errors="coerce")
+            .fillna(-1)
+            .to_numpy(dtype=np.int64)
+            .reshape(n_matches, 2, 11)
+        )
+        return cls(
+            index,
+            cols,
+            attributes.astype(np.float32),
+            player_ids,
+            positions,
+            goalkeeper,
+        )
+
+    def export_player_attributes(self, how: str = "all") -> pd.DataFrame:
+        """
+        Exports the player attributes of every match.
+
+        The columns and values are the same as those of MatchPlayers.export_player_attributes
+        for every match, but are computed for all matches at once.
+
+        Args:
+            how (str): 'all' for every player, 'diff' for home-away differences per slot,
+                'avg_diff' for differences in outfield player averages and 'avg' for
+                outfield player averages of both teams.
+
+        Returns:
+            DataFrame: The exported attributes indexed by match id.
+        """
+        n_matches, n_cols = len(self.index), len(self.cols)
+        values = self.attributes.astype(np.float64)
+        outfield, goaly = values[:, :, :10], values[:, :, 10]
+        blocks, names = [], []
+
+        if how == "all":
+            for side, code in enumerate(("H", "A")):
+                blocks += [
+                    outfield[:, side].reshape(n_matches, 10 * n_cols),
+                    goaly[:, side],
+                ]
+                names += [
+                    f"{col}_{code}_{i + 1}" for i in range(10) for col in self.cols
+                ]
+                names += [f"{col}_{code}_gk" for col in self.cols]
+
+        if how == "diff":
+            blocks += [
+                (outfield[:, 0] - outfield[:, 1]).reshape(n_matches, 10 * n_cols),
+                goaly[:, 0] - goaly[:, 1],
+            ]
+            names += [f"{col}_dif_{i + 1}" for i in range(10) for col in self.cols]
+            names += [f"{col}_dif_gk" for col in self.cols]
+
+        if how == "avg_diff":
+            sums = outfield.sum(axis=2)
+            avg_diff = (sums[:, 0] - sums[:, 1]) / 10
+            gk_diff = goaly[:, 0] - goaly[:, 1]
+            blocks.append(
+                np.stack([avg_diff, gk_diff], axis=-1).reshape(n_matches, 2 * n_cols)
+            )
+            for col in self.cols:
+                names += [col + "_avg_diff", col + "_avg_diff_gk"]
+
+        if how == "avg":
+            avg = outfield.sum(axis=2) / 10
+            for side, code in enumerate(("H", "A")):
+                blocks += [avg[:, side], goaly[:, side]]
+                names += [f"{col}_{code}_avg" for col in self.cols]
+                names += [f"{col}_{code}_gk" for col in self.cols]
+
+        data = np.hstack(blocks) if blocks else np.empty((n_matches, 0))
+        return pd.DataFrame(data, index=self.index, columns=names)
+
+
+def build_match_features(
+    matches: pd.DataFrame,
+    team_index: AttributeIndex,
+    player_index: AttributeIndex,
+    team_cols: List[str],
+    player_cols: List[str],
+    how: str = "avg_diff",
+    date_col: str = "date",
+) -> pd.DataFrame:
+    """
+    Builds the team and player features of every match.
+
+    The team attribute columns of the home team keep their names and those of the
+    away team get an '_away' suffix, as when joining the Team.get_latest_entry results.
+    The player attribute columns are those of MatchLineupTensor.export_player_attributes.
+
+    Args:
+        matches (DataFrame): The matches with 'home_team_api_id', 'away_team_api_id' and
+            lineup columns, indexed by match id.
+        team_index (AttributeIndex): An index of the team attribute entries.
+        player_index (AttributeIndex): An index of the player attribute entries.
+        team_cols (list[str]): The team attributes to use.
+        player_cols (list[str]): The player attributes to use.
+        how (str, optional): The player attribute export mode.
+        date_col (str, optional): The column of matches containing the match dates.
+
+    Returns:
+        DataFrame: The features indexed by match id.
+    """
+    team_attributes = team_index.lookup_array(
+        matches[["home_team_api_id", "away_team_api_id"]].to_numpy(dtype=object),
+        matches[date_col],
+        team_cols,
+    )
+    team_features = pd.DataFrame(
+        team_attributes.reshape(len(matches), -1),
+        index=matches.index,
+        columns=team_cols + [col + "_away" for col in team_cols],
+    )
+    player_features = MatchLineupTensor.from_matches(
+        matches, player_index, player_cols, date_col
+    ).export_player_attributes(how)
+    return pd.concat([team_features, player_features], axis=1)
+
+
+def stream_match_features(
+    batches: Iterable,
+    team_index: AttributeIndex,
+    player_index: AttributeIndex,
+    team_cols: List[str],
+    player_cols: List[str],
+    how: str = "avg_diff",
+    index_col: str = "id",
+    date_col: str = "date",
+) -> Iterator[pd.DataFrame]:
+    """
+    Builds the features of batches of matches, one batch at a time.
+
+    Every batch goes through lineup parsing, the as-of attribute lookups and the
+    feature export before the next one is read, so the peak memory depends on the
+    batch size rather than on the number of matches.
+
+    Args:
+        batches (Iterable): Arrow record batches or DataFrames of matches with an
+            index_col column, e.g. from iter_batches(con, "Match", MATCH_FEATURE_COLUMNS).
+        team_index (AttributeIndex): An index of the team attribute entries.
+        player_index (AttributeIndex): An index of the player attribute entries.
+        team_cols (list[str]): The team attributes to use.
+        player_cols (list[str]): The player attributes to use.
+        how (str, optional): The player attribute export mode.
+        index_col (str, optional): The column of the batches containing the match ids.
+        date_col (str, optional): The column of the batches containing the match dates.
+
+    Yields:
+        DataFrame: The features of every batch, indexed by match id.
+
+    Example:
+        >>> batches = iter_batches(con, "Match", MATCH_FEATURE_COLUMNS, 50_000)
+        >>> for features in stream_match_features(
+        ...     batches, team_index, player_index, team_cols, player_cols
+        ... ):
+        ...     features.to_parquet(...)
+    """
+    for batch in batches:
+        matches = batch if isinstance(batch, pd.DataFrame) else batch.to_pandas()
+        yield build_match_features(
+            matches.set_index(index_col),
+            team_index,
+            player_index,
+            team_cols,
+            player_cols,
+            how,
+            date_col,
+        )
+
+
+OUTCOMES = ["Home Loss", "Tie", "Home Win"]
+
+
+def encode_outcomes(outcomes) -> np.ndarray:
+    """
+    Encodes match outcomes as integer codes, in the order of OUTCOMES.
+
+    Parameters:
+        outcomes (array-like): Outcomes as 'Home Loss', 'Tie' or 'Home Win' strings,
+            or already as integer codes.
+
+    Returns:
+        np.ndarray: An int8 array with 0 for 'Home Loss', 1 for 'Tie', 2 for 'Home Win'
+        and -1 for anything else.
+    """
+    outcomes = np.asarray(outcomes)
+    if np.issubdtype(outcomes.dtype, np.integer):
+        return outcomes.astype(np.int8)
+    return pd.Categorical(outcomes, categories=OUTCOMES).codes.astype(np.int8)
+
+
 def outcome_guess_prob_dif(row: pd.Series, coef_a: float, coef_b: float) -> str:
     """
     Predicts the match outcome based on the difference between win and loss probabilities.
@@ -295,13 +1069,96 @@ def classifier_train_prob_dif(
     Returns:
         np.ndarray: An array of integers indicating whether the predictions match the actual outcomes.
     """
-    coef_a = params["coef_a"]
-    coef_b = params["coef_b"]
-    guess = prob_data.apply(outcome_guess_prob_dif, axis=1, args=(coef_a, coef_b))
-    sum_false = ~(guess.values == y_data.values)
+    coef_a = float(params["coef_a"])
+    coef_b = float(params["coef_b"])
+    guess = predict_prob_dif(prob_data["win"], prob_data["loss"], coef_a, coef_b)
+    sum_false = guess != encode_outcomes(y_data)
     return sum_false.astype(int)
 
 
+def predict_prob_dif(win, loss, coef_a: float, coef_b: float) -> np.ndarray:
+    """
+    Predicts match outcome codes based on the difference between win and loss probabilities.
+
+    This is the vectorized equivalent of outcome_guess_prob_dif.
+
+    Parameters:
+        win (array-like): The home win probabilities.
+        loss (array-like): The home loss probabilities.
+        coef_a (float): The threshold coefficient for predicting a 'Home Win' outcome.
+        coef_b (float): The threshold coefficient for predicting a 'Home Loss' outcome.
+
+    Returns:
+        np.ndarray: The predicted outcome codes, see encode_outcomes.
+    """
+    dif = np.asarray(win, dtype=np.float64) - np.asarray(loss, dtype=np.float64)
+    return np.select([dif > coef_a, dif < -coef_b], [2, 0], default=1).astype(np.int8)
+
+
+def _split_by_outcome(values, y_data) -> Tuple[List[np.ndarray], int, int]:
+    """
+    Sorts values separately for every outcome code, setting NaN values aside.
+
+    Returns:
+        tuple: The sorted non-NaN values of every outcome in the order of OUTCOMES,
+        the number of 'Tie' outcomes with NaN values and the number of values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    codes = encode_outcomes(y_data)
+    nan = np.isnan(values)
+    sorted_values = [
+        np.sort(values[(codes == code) & ~nan]) for code in range(len(OUTCOMES))
+    ]
+    return sorted_values, int(np.sum(nan & (codes == 1))), len(values)
+
+
+def prob_dif_error_grid(
+    prob_data: pd.DataFrame, y_data: pd.Series, coefs_a, coefs_b
+) -> np.ndarray:
+    """
+    Counts the wrong predictions of predict_prob_dif over a whole grid of threshold coefficients.
+
+    The probability differences are sorted once per outcome, after which the number of
+    correct predictions for every (coef_a, coef_b) pair follows from binary searches.
+    The counts are exact, so the best thresholds can be found with argmin instead of
+    a minimizer.
+
+    Parameters:
+        prob_data (pd.DataFrame): A pandas DataFrame containing 'win' and 'loss' probabilities.
+        y_data (pd.Series): The actual match outcomes.
+        coefs_a (array-like): The 'Home Win' threshold coefficients to evaluate.
+        coefs_b (array-like): The 'Home Loss' threshold coefficients to evaluate.
+
+    Returns:
+        np.ndarray: The number of wrong predictions, of shape (len(coefs_a), len(coefs_b)).
+
+    Example:
+        errors = prob_dif_error_grid(predicts_both, y_train, coefs_a, coefs_b)
+        i, j = np.unravel_index(errors.argmin(), errors.shape)
+        best_a, best_b = coefs_a[i], coefs_b[j]
+    """
+    dif = prob_data["win"].to_numpy(dtype=np.float64) - prob_data["loss"].to_numpy(
+        dtype=np.float64
+    )
+    (loss, tie, win), nan_ties, n_values = _split_by_outcome(dif, y_data)
+    coef_a = np.asarray(coefs_a, dtype=np.float64)[:, None]
+    neg_b = -np.asarray(coefs_b, dtype=np.float64)[None, :]
+
+    correct_win = len(win) - np.searchsorted(win, coef_a, side="right")
+    correct_loss = np.where(
+        coef_a >= neg_b,
+        np.searchsorted(loss, neg_b, side="left"),
+        np.searchsorted(loss, coef_a, side="right"),
+    )
+    correct_tie = np.clip(
+        np.searchsorted(tie, coef_a, side="right")
+        - np.searchsorted(tie, neg_b, side="left"),
+        0,
+        None,
+    )
+    return n_values - (correct_win + correct_loss + correct_tie + nan_ties)
+
+
 def outcome_guess_prob_win(x: float, coef_win: float, coef_loss: float) -> str:
     """
     Assigns a match outcome value based on the probability of home team win
@@ -338,13 +1195,68 @@ def classifier_train_prob_win(
     Returns:
         np.ndarray: An array of integers indicating whether the predictions match the actual outcomes.
     """
-    coef_win = params["coef_win"]
-    coef_loss = params["coef_loss"]
-    guess = probs.apply(outcome_guess_prob_win, args=(coef_win, coef_loss))
-    sum_false = ~(guess.values == y_data.values)
+    coef_win = float(params["coef_win"])
+    coef_loss = float(params["coef_loss"])
+    guess = predict_prob_win(probs, coef_win, coef_loss)
+    sum_false = guess != encode_outcomes(y_data)
     return sum_false.astype(int)
 
 
+def predict_prob_win(probs, coef_win: float, coef_loss: float) -> np.ndarray:
+    """
+    Predicts match outcome codes based on the probability of home team win.
+
+    This is the vectorized equivalent of outcome_guess_prob_win.
+
+    Parameters:
+        probs (array-like): The home win probabilities.
+        coef_win (float): The threshold coefficient for predicting a 'Home Win' outcome.
+        coef_loss (float): The threshold coefficient for predicting a 'Home Loss' outcome.
+
+    Returns:
+        np.ndarray: The predicted outcome codes, see encode_outcomes.
+    """
+    x = np.asarray(probs, dtype=np.float64)
+    return np.select([x >= 1 - coef_win, x <= coef_loss], [2, 0], default=1).astype(
+        np.int8
+    )
+
+
+def prob_win_error_grid(
+    probs: pd.Series, y_data: pd.Series, coefs_win, coefs_loss
+) -> np.ndarray:
+    """
+    Counts the wrong predictions of predict_prob_win over a whole grid of threshold coefficients.
+
+    Parameters:
+        probs (pd.Series): The home win probabilities.
+        y_data (pd.Series): The actual match outcomes.
+        coefs_win (array-like): The 'Home Win' threshold coefficients to evaluate.
+        coefs_loss (array-like): The 'Home Loss' threshold coefficients to evaluate.
+
+    Returns:
+        np.ndarray: The number of wrong predictions, of shape
+        (len(coefs_win), len(coefs_loss)).
+    """
+    (loss, tie, win), nan_ties, n_values = _split_by_outcome(probs, y_data)
+    win_cut = 1 - np.asarray(coefs_win, dtype=np.float64)[:, None]
+    coef_loss = np.asarray(coefs_loss, dtype=np.float64)[None, :]
+
+    correct_win = len(win) - np.searchsorted(win, win_cut, side="left")
+    correct_loss = np.where(
+        coef_loss < win_cut,
+        np.searchsorted(loss, coef_loss, side="right"),
+        np.searchsorted(loss, win_cut, side="left"),
+    )
+    correct_tie = np.clip(
+        np.searchsorted(tie, win_cut, side="left")
+        - np.searchsorted(tie, coef_loss, side="right"),
+        0,
+        None,
+    )
+    return n_values - (correct_win + correct_loss + correct_tie + nan_ties)
+
+
 def bet_home(row: Dict[str, Any]) -> float:
     """
     Calculate the profit for a bet on a home win.
@@ -412,3 +1324,64 @@ def bet_tie(row: Dict[str, Any]) -> float:
         else:
             profit = -100
     return profit
+
+
+def backtest_bets(
+    bets: np.ndarray,
+    outcomes: np.ndarray,
+    odds: np.ndarray,
+    stake: float = 100,
+    strategy: str = "flat",
+    probs: np.ndarray = None,
+    kelly_fraction: float = 1.0,
+    bankroll: float = 1000,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculates the profit of betting on many matches at once.
+
+    The last two axes of bets, odds and probs are (match, outcome), with outcomes in
+    the order of OUTCOMES. Any leading axes are broadcast, so several bookmakers,
+    thresholds or strategies can be evaluated in one call, e.g. odds of shape
+    (n_bookmakers, n_matches, 3). As in bet_home, bet_away and bet_tie, a won bet
+    pays odds * stake and a lost bet costs the stake.
+
+    Parameters:
+        bets (np.ndarray): A boolean array marking the outcomes bet on, e.g.
+            np.column_stack([away_win_pred == 1, tie_pred == "Tie", home_win_pred == 1]).
+        outcomes (np.ndarray): The actual outcome codes of shape (n_matches,), see
+            encode_outcomes.
+        odds (np.ndarray): The betting odds of every outcome.
+        stake (float): The stake of every bet with the 'flat' strategy.
+        strategy (str): 'flat' for a fixed stake, or 'kelly' for a fraction of the
+            bankroll given by the Kelly criterion.
+        probs (np.ndarray, optional): The predicted outcome probabilities, required for
+            the 'kelly' strategy.
+        kelly_fraction (float): The fraction of the Kelly stake to bet.
+        bankroll (float): The bankroll the Kelly stakes are a fraction of. It is not
+            updated between matches, so the bets are independent.
+
+    Returns:
+        tuple: The profit of every bet, of the broadcast shape of the inputs, and the
+        cumulative profit over matches, summed over outcomes.
+
+    Raises:
+        ValueError: If the strategy is unknown or probs are missing for 'kelly'.
+    """
+    bets = np.asarray(bets, dtype=bool)
+    odds = np.asarray(odds, dtype=np.float64)
+    won = encode_outcomes(outcomes)[:, None] == np.arange(len(OUTCOMES))
+
+    if strategy == "flat":
+        stakes = np.full(odds.shape, float(stake))
+    elif strategy == "kelly":
+        if probs is None:
+            raise ValueError("Predicted probabilities are required for Kelly stakes.")
+        probs = np.asarray(probs, dtype=np.float64)
+        kelly = np.clip(probs - (1 - probs) / odds, 0, None)
+        stakes = np.nan_to_num(kelly_fraction * kelly * bankroll)
+    else:
+        raise ValueError(f"Unknown staking strategy '{strategy}'.")
+
+    profit = np.where(bets, np.where(won, odds * stakes, -stakes), 0.0)
+    cumulative_profit = np.nancumsum(np.nansum(profit, axis=-1), axis=-1)
+    return profit, cumulative_profit
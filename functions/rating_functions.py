@@ -0,0 +1,203 @@
+import warnings
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+
+class RatingEngine:
+    """
+    An incremental Elo rating and form tracker that walks matches in date order.
+
+    The features of every match are recorded before the match result is applied, so
+    they only depend on earlier matches. Matches without goals, such as scheduled or
+    postponed fixtures, get their pre-match features but do not change any rating or
+    form. All team state is held in arrays indexed by an internal team number, and the
+    form windows are fixed size ring buffers with running sums, so every match is
+    processed in constant time.
+
+    Attributes:
+        k_factor (float): The Elo K-factor.
+        home_advantage (float): The Elo points added to the home team's rating when
+            calculating the expected result.
+        initial_rating (float): The Elo rating of a team before its first match.
+        window (int): The number of matches in the form windows.
+        features (DataFrame): The pre-match features of every processed match, indexed
+            by match id.
+
+    Methods:
+        update(matches: DataFrame) -> DataFrame:
+            Processes matches that were not processed before and returns their features.
+    """
+
+    feature_names = [
+        "home_elo",
+        "away_elo",
+        "home_goal_diff_form",
+        "away_goal_diff_form",
+        "home_home_form",
+        "away_away_form",
+    ]
+
+    def __init__(
+        self,
+        k_factor: float = 20.0,
+        home_advantage: float = 100.0,
+        initial_rating: float = 1500.0,
+        window: int = 5,
+    ):
+        self.k_factor = k_factor
+        self.home_advantage = home_advantage
+        self.initial_rating = initial_rating
+        self.window = window
+        self.features = pd.DataFrame(columns=self.feature_names, dtype=np.float64)
+
+        self._team_numbers: Dict[Any, int] = {}
+        self._last_date = None
+        # The processed matches that had no result yet
+        self._unplayed = set()
+        self._elo = np.empty(0)
+        # One ring buffer, running sum and count per team for every form window
+        self._buffers = {
+            name: np.empty((0, window)) for name in ("goal_diff", "home", "away")
+        }
+        self._sums = {name: np.empty(0) for name in self._buffers}
+        self._counts = {name: np.empty(0, dtype=np.int64) for name in self._buffers}
+
+    def _team_number(self, team_id) -> int:
+        """Returns the internal number of a team, growing the state arrays for new teams."""
+        number = self._team_numbers.get(team_id)
+        if number is not None:
+            return number
+
+        number = len(self._team_numbers)
+        self._team_numbers[team_id] = number
+        if number >= len(self._elo):
+            capacity = max(2 * len(self._elo), 64)
+            grow = capacity - len(self._elo)
+            self._elo = np.append(self._elo, np.full(grow, self.initial_rating))
+            for name in self._buffers:
+                self._buffers[name] = np.vstack(
+                    [self._buffers[name], np.zeros((grow, self.window))]
+                )
+                self._sums[name] = np.append(self._sums[name], np.zeros(grow))
+                self._counts[name] = np.append(
+                    self._counts[name], np.zeros(grow, dtype=np.int64)
+                )
+        return number
+
+    def _form(self, name: str, team: int) -> float:
+        """Returns the mean of a team's form window, NaN if it is empty."""
+        count = min(self._counts[name][team], self.window)
+        return self._sums[name][team] / count if count else np.nan
+
+    def _push(self, name: str, team: int, value: float) -> None:
+        """Adds a value to a team's form window, replacing the oldest one when full."""
+        slot = self._counts[name][team] % self.window
+        if self._counts[name][team] >= self.window:
+            self._sums[name][team] -= self._buffers[name][team, slot]
+        self._buffers[name][team, slot] = value
+        self._sums[name][team] += value
+        self._counts[name][team] += 1
+
+    def update(self, matches: pd.DataFrame) -> pd.DataFrame:
+        """
+        Processes the matches that were not processed before, in date order.
+
+        Args:
+            matches (DataFrame): Matches indexed by match id with 'date',
+                'home_team_api_id', 'away_team_api_id', 'home_team_goal' and
+                'away_team_goal' columns.
+
+        Matches with a missing goal count get their pre-match features but leave the
+        ratings and forms unchanged. When a later update includes the result of such a
+        match, it is processed again if no later match was processed in the meantime.
+        Otherwise its result would be applied to ratings that already contain later
+        results, so it is skipped with a warning and its features are kept.
+
+        Returns:
+            DataFrame: The pre-match features of the new matches, indexed by match id.
+
+        Raises:
+            ValueError: If a new match is dated before the latest processed match with
+                a result, since including it would require recomputing the history
+                after it.
+        """
+        goal_diffs = pd.to_numeric(matches["home_team_goal"]) - pd.to_numeric(
+            matches["away_team_goal"]
+        )
+        seen = matches.index.isin(self.features.index)
+        replayed = seen & matches.index.isin(self._unplayed) & goal_diffs.notna()
+        stale = replayed & (
+            pd.to_datetime(matches["date"]) < self._last_date
+            if self._last_date is not None
+            else False
+        )
+        if stale.any():
+            warnings.warn(
+                f"The results of {int(stale.sum())} earlier unplayed matches are "
+                "skipped, since later matches were processed in the meantime."
+            )
+            self._unplayed.difference_update(matches.index[stale])
+        matches = matches.loc[~seen | (replayed & ~stale)]
+        matches = matches.assign(date=pd.to_datetime(matches["date"]))
+        matches = matches.sort_values("date", kind="mergesort")
+        if len(matches) == 0:
+            return self.features.iloc[:0]
+        if self._last_date is not None and matches["date"].iloc[0] < self._last_date:
+            raise ValueError(
+                "New matches must not be dated before the latest processed match."
+            )
+
+        home_teams = [self._team_number(team) for team in matches["home_team_api_id"]]
+        away_teams = [self._team_number(team) for team in matches["away_team_api_id"]]
+        goal_diffs = goal_diffs.loc[matches.index].to_numpy(dtype=np.float64)
+        features = np.empty((len(matches), len(self.feature_names)))
+
+        for i, (home, away, goal_diff) in enumerate(
+            zip(home_teams, away_teams, goal_diffs)
+        ):
+            features[i] = (
+                self._elo[home],
+                self._elo[away],
+                self._form("goal_diff", home),
+                self._form("goal_diff", away),
+                self._form("home", home),
+                self._form("away", away),
+            )
+            if np.isnan(goal_diff):
+                continue
+
+            expected = 1 / (
+                1
+                + 10
+                ** ((self._elo[away] - self._elo[home] - self.home_advantage) / 400)
+            )
+            result = 1.0 if goal_diff > 0 else (0.5 if goal_diff == 0 else 0.0)
+            change = self.k_factor * (result - expected)
+            self._elo[home] += change
+            self._elo[away] -= change
+
+            self._push("goal_diff", home, goal_diff)
+            self._push("goal_diff", away, -goal_diff)
+            self._push("home", home, 3 * result if result != 0.5 else 1.0)
+            self._push("away", away, 3 * (1 - result) if result != 0.5 else 1.0)
+
+        played = ~np.isnan(goal_diffs)
+        if played.any():
+            self._last_date = matches["date"].iloc[np.flatnonzero(played)[-1]]
+        self._unplayed.difference_update(matches.index[played])
+        self._unplayed.update(matches.index[~played])
+
+        new_features = pd.DataFrame(
+            features, index=matches.index, columns=self.feature_names
+        )
+        self.features = self.features.drop(
+            self.features.index.intersection(matches.index)
+        )
+        self.features = (
+            pd.concat([self.features, new_features])
+            if len(self.features)
+            else new_features
+        )
+        return new_features
@@ -0,0 +1,441 @@
+import argparse
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from functions.data_format_functions import FeatureScaler
+from functions.instrumentation_functions import instrument
+from functions.model_functions import sigmoid
+from functions.project_functions_classes import (
+    OUTCOMES,
+    AttributeIndex,
+    MatchLineupTensor,
+    predict_prob_dif,
+    predict_prob_win,
+)
+
+# The odds keys of a fixture, in the order of OUTCOMES
+ODDS_KEYS = ["away_win_coef", "tie_coef", "home_win_coef"]
+
+
+def model_spec(
+    win: Tuple[FeatureScaler, Any],
+    loss: Tuple[FeatureScaler, Any],
+    team_cols: List[str],
+    player_cols: List[str],
+    how: str = "avg_diff",
+    decision: Optional[Dict[str, Any]] = None,
+    stake: float = 100,
+) -> Dict[str, Any]:
+    """
+    Collects a trained home win and home loss model into a JSON serializable spec.
+
+    Args:
+        win (tuple): The FeatureScaler of the home win model's design matrix and its
+            coefficients, the intercept first, e.g. a row of l1_logit_path.
+        loss (tuple): The same for the home loss model.
+        team_cols (list[str]): The team attributes the features were built with.
+        player_cols (list[str]): The player attributes the features were built with.
+        how (str, optional): The player attribute export mode of the features.
+        decision (dict, optional): The decision rule, either {'rule': 'prob_dif',
+            'coef_a': ..., 'coef_b': ...} or {'rule': 'prob_win', 'coef_win': ...,
+            'coef_loss': ...}. Defaults to prob_dif with both thresholds at 0.
+        stake (float, optional): The stake the expected profit is calculated for.
+
+    Returns:
+        dict: The model spec, see FixtureScorer.
+
+    Example:
+        >>> spec = model_spec(
+        ...     (win_train.scaler, win_path.loc[alpha]),
+        ...     (loss_train.scaler, loss_path.loc[alpha]),
+        ...     team_cols, player_cols, decision={"rule": "prob_dif", "coef_a": 0.1, "coef_b": 0.2},
+        ... )
+    """
+    models = {}
+    for name, (scaler, coef) in (("win", win), ("loss", loss)):
+        models[name] = {
+            "scaler": scaler.to_dict(),
+            "coef": np.asarray(coef, dtype=np.float64).tolist(),
+        }
+    return {
+        "team_cols": list(team_cols),
+        "player_cols": list(player_cols),
+        "how": how,
+        "models": models,
+        "decision": decision or {"rule": "prob_dif", "coef_a": 0.0, "coef_b": 0.0},
+        "stake": stake,
+    }
+
+
+def _feature_names(team_cols: List[str], player_cols: List[str], how: str) -> List[str]:
+    """Returns the column names of build_match_features for the given attributes."""
+    empty = MatchLineupTensor(
+        pd.RangeIndex(0),
+        player_cols,
+        np.empty((0, 2, 11, len(player_cols)), dtype=np.float32),
+        np.empty((0, 2, 11), dtype=np.int64),
+        np.empty((0, 2, 11, 2), dtype=np.float32),
+        np.empty((0, 2, 11), dtype=bool),
+    )
+    player_names = list(empty.export_player_attributes(how).columns)
+    return team_cols + [col + "_away" for col in team_cols] + player_names
+
+
+def _json_values(values: np.ndarray) -> list:
+    """Converts an array to a list with None in place of NaN, which JSON cannot hold."""
+    values = np.asarray(values, dtype=object)
+    values[pd.isna(values)] = None
+    return values.tolist()
+
+
+class FixtureScorer:
+    """
+    Scores batches of upcoming fixtures with a trained home win and home loss model.
+
+    Everything that does not depend on the fixtures is prepared once: the attribute
+    indexes, the position of every model feature in the feature matrix, and the
+    scaler statistics and coefficients as arrays. Scoring a batch is then a handful of
+    array operations, without filtering any attribute DataFrame per fixture.
+
+    The features are those of build_match_features. The tie probability is what the
+    two binary models leave, 1 - win - loss clipped to [0, 1]. The expected profit is
+    that of a bet on the decided outcome, following bet_home, bet_away and bet_tie: a
+    won bet pays odds * stake and a lost bet costs the stake.
+
+    A fixture is a dict with:
+        - 'date': The match date, e.g. '2016-05-14'.
+        - 'home_team_api_id' and 'away_team_api_id'.
+        - 'home_player_ids' and 'away_player_ids': The 11 player ids of each lineup.
+        - 'home_positions' and 'away_positions': The 11 (X, Y) lineup coordinates.
+        - 'home_win_coef', 'tie_coef' and 'away_win_coef' (optional): The odds.
+
+    Attributes:
+        team_index (AttributeIndex): The team attribute entries, e.g. the latest snapshots.
+        player_index (AttributeIndex): The player attribute entries.
+        spec (dict): The model spec, see model_spec.
+        feature_names (list[str]): The columns of the feature matrix.
+
+    Methods:
+        from_snapshot_cache(cache_path, spec) -> FixtureScorer:
+            Creates a scorer from the latest snapshots of attach_snapshot_cache.
+        load(model_path, cache_path) -> FixtureScorer:
+            Creates a scorer from a spec saved as JSON and a snapshot cache.
+        features(fixtures) -> np.ndarray: Builds the feature matrix of fixtures.
+        score(fixtures) -> dict: Scores fixtures.
+        score_json(fixtures) -> dict: Scores fixtures into JSON serializable lists.
+    """
+
+    def __init__(
+        self,
+        team_index: AttributeIndex,
+        player_index: AttributeIndex,
+        spec: Dict[str, Any],
+    ):
+        self.team_index = team_index
+        self.player_index = player_index
+        self.spec = spec
+        self.team_cols = list(spec["team_cols"])
+        self.player_cols = list(spec["player_cols"])
+        self.how = spec["how"]
+        self.feature_names = _feature_names(self.team_cols, self.player_cols, self.how)
+        self.stake = float(spec.get("stake", 100))
+
+        decision = dict(spec["decision"])
+        self.rule = decision.pop("rule")
+        if self.rule not in ("prob_dif", "prob_win"):
+            raise ValueError(f"Unknown decision rule '{self.rule}'.")
+        self.thresholds = {key: float(value) for key, value in decision.items()}
+
+        # Per model: feature positions, scaler statistics and coefficients
+        positions = {name: i for i, name in enumerate(self.feature_names)}
+        self._models = {}
+        for name in ("win", "loss"):
+            scaler = FeatureScaler.from_dict(spec["models"][name]["scaler"])
+            missing = [col for col in scaler.columns if col not in positions]
+            if missing:
+                raise KeyError(f"The {name} model uses unknown features: {missing}")
+            coef = np.asarray(spec["models"][name]["coef"], dtype=np.float64)
+            self._models[name] = (
+                np.array([positions[col] for col in scaler.columns], dtype=np.intp),
+                scaler.mean,
+                scaler.scale,
+                coef[0],
+                coef[1:],
+            )
+
+        # Warm up the cached value arrays of the indexes
+        self.team_index.values(self.team_cols)
+        self.player_index.values(self.player_cols)
+
+    @classmethod
+    def from_snapshot_cache(
+        cls, cache_path: str, spec: Dict[str, Any]
+    ) -> "FixtureScorer":
+        """
+        Creates a scorer from the latest attribute snapshots of attach_snapshot_cache.
+
+        Args:
+            cache_path (str): The DuckDB snapshot cache file.
+            spec (dict): The model spec, see model_spec.
+
+        Returns:
+            FixtureScorer: The scorer.
+        """
+        with duckdb.connect(cache_path, read_only=True) as con:
+            teams = con.query("SELECT * FROM team_latest").df()
+            players = con.query("SELECT * FROM player_latest").df()
+        return cls(
+            AttributeIndex(teams, "team_api_id"),
+            AttributeIndex(players, "player_api_id"),
+            spec,
+        )
+
+    @classmethod
+    def load(cls, model_path: str, cache_path: str) -> "FixtureScorer":
+        """
+        Creates a scorer from a model spec saved as JSON and a snapshot cache.
+
+        Args:
+            model_path (str): The JSON file of the model spec.
+            cache_path (str): The DuckDB snapshot cache file.
+
+        Returns:
+            FixtureScorer: The scorer.
+        """
+        with open(model_path) as file:
+            spec = json.load(file)
+        return cls.from_snapshot_cache(cache_path, spec)
+
+    def _arrays(self, fixtures: List[Dict[str, Any]]) -> Tuple[np.ndarray, ...]:
+        """Converts fixtures to team id, player id, position, date and odds arrays."""
+        team_ids = np.array(
+            [[f["home_team_api_id"], f["away_team_api_id"]] for f in fixtures],
+            dtype=object,
+        ).reshape(-1, 2)
+        player_ids = np.array(
+            [[f["home_player_ids"], f["away_player_ids"]] for f in fixtures],
+            dtype=object,
+        ).reshape(-1, 2, 11)
+        positions = np.array(
+            [[f["home_positions"], f["away_positions"]] for f in fixtures],
+            dtype=np.float32,
+        ).reshape(-1, 2, 11, 2)
+        dates = np.array([f["date"] for f in fixtures], dtype="datetime64[ns]")
+        odds = np.array(
+            [[f.get(key, np.nan) for key in ODDS_KEYS] for f in fixtures],
+            dtype=np.float64,
+        ).reshape(-1, len(OUTCOMES))
+        return team_ids, player_ids, positions, dates, odds
+
+    def _features(self, team_ids, player_ids, positions, dates) -> np.ndarray:
+        n_fixtures = len(dates)
+        team_features = self.team_index.lookup_array(
+            team_ids, dates, self.team_cols
+        ).reshape(n_fixtures, -1)
+        player_features = MatchLineupTensor.from_arrays(
+            pd.RangeIndex(n_fixtures),
+            player_ids,
+            positions,
+            dates,
+            self.player_index,
+            self.player_cols,
+        ).export_player_attributes(self.how)
+        return np.hstack([team_features, player_features.to_numpy()])
+
+    def features(self, fixtures: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Builds the feature matrix of fixtures.
+
+        Args:
+            fixtures (list[dict]): The fixtures.
+
+        Returns:
+            np.ndarray: An array of shape (n_fixtures, len(feature_names)), NaN where a
+            team or player has no attribute entry before the fixture date.
+        """
+        return self._features(*self._arrays(fixtures)[:4])
+
+    def _probability(self, name: str, features: np.ndarray) -> np.ndarray:
+        positions, mean, scale, intercept, coef = self._models[name]
+        scaled = (features[:, positions] - mean) / scale
+        return sigmoid(intercept + scaled @ coef)
+
+    @instrument("FixtureScorer.score")
+    def score(self, fixtures: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """
+        Scores fixtures.
+
+        Args:
+            fixtures (list[dict]): The fixtures.
+
+        Returns:
+            dict: Arrays with one value per fixture:
+                - 'home_win', 'tie' and 'home_loss': The outcome probabilities.
+                - 'outcome': The decided outcome code, see encode_outcomes.
+                - 'expected_profit': The expected profit of a bet on the decided
+                  outcome, NaN without odds.
+            Fixtures with missing attributes have NaN probabilities, no decided
+            outcome (-1) and a NaN expected profit.
+        """
+        team_ids, player_ids, positions, dates, odds = self._arrays(fixtures)
+        features = self._features(team_ids, player_ids, positions, dates)
+        win = self._probability("win", features)
+        loss = self._probability("loss", features)
+        tie = np.clip(1 - win - loss, 0, 1)
+
+        if self.rule == "prob_dif":
+            outcome = predict_prob_dif(win, loss, **self.thresholds)
+        else:
+            outcome = predict_prob_win(win, **self.thresholds)
+        outcome[np.isnan(win) | np.isnan(loss)] = -1
+
+        probs = np.column_stack([loss, tie, win])
+        rows = np.arange(len(outcome))
+        prob, price = probs[rows, outcome], odds[rows, outcome]
+        expected_profit = prob * price * self.stake - (1 - prob) * self.stake
+        return {
+            "home_win": win,
+            "tie": tie,
+            "home_loss": loss,
+            "outcome": outcome,
+            "expected_profit": expected_profit,
+        }
+
+    def score_json(self, fixtures: List[Dict[str, Any]]) -> Dict[str, list]:
+        """
+        Scores fixtures into JSON serializable lists, with outcome names.
+
+        Args:
+            fixtures (list[dict]): The fixtures.
+
+        Returns:
+            dict: The scores as lists, with None in place of NaN and of missing outcomes.
+        """
+        scores = self.score(fixtures)
+        result = {key: _json_values(values) for key, values in scores.items()}
+        result["outcome"] = [
+            OUTCOMES[code] if code >= 0 else None for code in scores["outcome"]
+        ]
+        return result
+
+
+def _handler(scorer: FixtureScorer) -> type:
+    """Creates a request handler class that scores with the given scorer."""
+
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _respond(self, status: int, body: Dict[str, Any]) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._respond(200, {"status": "ok"})
+            else:
+                self._respond(404, {"error": "Not found."})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._respond(404, {"error": "Not found."})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length))
+                fixtures = body["fixtures"] if isinstance(body, dict) else body
+                self._respond(200, scorer.score_json(fixtures))
+            except (ValueError, KeyError, TypeError) as error:
+                self._respond(400, {"error": f"{type(error).__name__}: {error}"})
+            except Exception as error:
+                # Any other error is a fault of the scorer, not of the request
+                self._respond(
+                    500, {"error": f"Internal error: {type(error).__name__}: {error}"}
+                )
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+def serve(
+    scorer: FixtureScorer,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    background: bool = False,
+) -> ThreadingHTTPServer:
+    """
+    Serves a scorer over HTTP.
+
+    POST /score takes a JSON list of fixtures, or {'fixtures': [...]}, and returns the
+    lists of FixtureScorer.score_json. GET /health returns {'status': 'ok'}.
+
+    Args:
+        scorer (FixtureScorer): The scorer.
+        host (str, optional): The host to bind to.
+        port (int, optional): The port to bind to, 0 for any free port.
+        background (bool, optional): Whether to serve from a daemon thread and return
+            immediately, e.g. to run the endpoint in a notebook or a test process.
+
+    Returns:
+        ThreadingHTTPServer: The server. Call shutdown() to stop a background server.
+
+    Example:
+        >>> server = serve(scorer, port=0, background=True)
+        >>> url = f"http://127.0.0.1:{server.server_address[1]}/score"
+        >>> server.shutdown()
+    """
+    server = ThreadingHTTPServer((host, port), _handler(scorer))
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Scores upcoming fixtures with a trained win/loss model."
+    )
+    parser.add_argument("--model", required=True, help="The JSON model spec.")
+    parser.add_argument(
+        "--snapshots", required=True, help="The DuckDB snapshot cache file."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    score_parser = commands.add_parser("score", help="Scores a JSON file of fixtures.")
+    score_parser.add_argument(
+        "fixtures", nargs="?", default="-", help="The fixtures file, - for stdin."
+    )
+    serve_parser = commands.add_parser("serve", help="Serves the scorer over HTTP.")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    scorer = FixtureScorer.load(args.model, args.snapshots)
+    if args.command == "score":
+        if args.fixtures == "-":
+            fixtures = json.load(sys.stdin)
+        else:
+            with open(args.fixtures) as file:
+                fixtures = json.load(file)
+        print(json.dumps(scorer.score_json(fixtures)))
+    else:
+        serve(scorer, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
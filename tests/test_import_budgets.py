@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(*args: str) -> subprocess.CompletedProcess:
+    """Runs Python with the given arguments in a fresh process from the repository root."""
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, capture_output=True, text=True
+    )
+
+
+def test_modules_import_within_budget():
+    result = _run("-m", "functions.benchmark_functions", "--check-imports")
+    assert result.returncode == 0, result.stderr
+
+
+def test_exceeded_budget_fails():
+    result = _run(
+        "-c",
+        "from functions.benchmark_functions import check_import_budgets\n"
+        "check_import_budgets({'functions.db_functions': 0.0}, repeat=1)",
+    )
+    assert result.returncode != 0
+    assert "over their import budget" in result.stderr